@@ -1,20 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.security import HTTPAuthorizationCredentials
 
-from sqlmodel import Session, select
-from app.db.database import get_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db.database import get_async_session
 from app.models.user import User
-from app.core.security import verify_password
-from app.auth.auth import create_access_token
-from app.schemas.token import  LoginData
+from app.core.security import verify_password_async
+from app.core.config import RATE_LIMIT_ENABLED
+from app.core.rate_limit import login_account_limiter
+from app.auth.auth import bearer_scheme, decode_token, issue_tokens, revoke_token, rotate_refresh_token
+from app.schemas.token import LoginData, RefreshRequest, TokenPair
 
 router = APIRouter()
 
 @router.post("/login")
-def login(data: LoginData, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == data.email)).first()
-    if not user or not verify_password(data.password, user.hashed_password):
+async def login(data: LoginData, session: AsyncSession = Depends(get_async_session)):
+    # Límite por cuenta antes de consultar la base de datos o ejecutar bcrypt
+    # (el límite por IP ya lo aplica RateLimitMiddleware)
+    if RATE_LIMIT_ENABLED:
+        await login_account_limiter.check(data.email.strip().lower())
+
+    user = (await session.exec(select(User).where(User.email == data.email))).first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    # bcrypt se ejecuta en el pool de procesos
+    valid, new_hash = await verify_password_async(data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    token = create_access_token({"sub": str(user.id)})
-    return {"access_token": token,  "token_type": "bearer", "full_name": user.full_name, "username": user.username, }
+    # Si cambió el coste de bcrypt, guardamos el hash regenerado
+    if new_hash:
+        user.hashed_password = new_hash
+        session.add(user)
+        await session.commit()
+
+    # Token de acceso corto y refresh token para renovarlo sin volver a pasar por bcrypt
+    return {**issue_tokens(user), "full_name": user.full_name, "username": user.username}
+
+
+@router.post("/token/refresh", response_model=TokenPair)
+async def refresh_token(data: RefreshRequest):
+    """Renueva el token de acceso; el refresh token usado se invalida y se devuelve otro"""
+    return await rotate_refresh_token(data.refresh_token)
+
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+    """Revoca el token de acceso y todos los tokens de su sesión, incluido el refresh token"""
+    await revoke_token(decode_token(credentials.credentials))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
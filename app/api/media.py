@@ -0,0 +1,207 @@
+import os
+import stat
+from pathlib import Path
+
+import anyio
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from starlette.types import Message, Receive, Scope, Send
+
+from app.core.config import MEDIA_CACHE_MAX_AGE, MEDIA_DOWNLOAD_URL_EXPIRES, MEDIA_PUBLIC_BASE_URL
+from app.core.responses import etag_matches
+from app.storage import UploadTooLarge, get_storage
+from app.utils.media_store import media_index, media_path, pending_path, is_content_key
+from app.utils.image_variants import (
+    accepted_variant_formats, closest_variant_size, variant_filename, VARIANT_FORMATS
+)
+
+router = APIRouter()
+
+# Los nombres de archivo son únicos y nunca se reescriben, así que se pueden cachear para siempre
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable"
+# Originales pendientes de optimizar: cambiarán en breve
+PENDING_CACHE_CONTROL = "no-cache"
+# Redirecciones a un almacenamiento remoto: las URLs públicas no cambian, las firmadas
+# se cachean como mucho la mitad de su validez
+REDIRECT_CACHE_CONTROL = (
+    f"public, max-age={MEDIA_CACHE_MAX_AGE}" if MEDIA_PUBLIC_BASE_URL
+    else f"private, max-age={MEDIA_DOWNLOAD_URL_EXPIRES // 2}"
+)
+
+
+class MediaFileResponse(FileResponse):
+    """
+    FileResponse que envía el archivo sin copias (sendfile) mediante la extensión ASGI
+    'http.response.pathsend' cuando el servidor la soporta. Los rangos y HEAD siguen
+    el camino normal de FileResponse.
+
+    El stat puede venir de media_index y el archivo haber desaparecido desde entonces
+    (lo borra la cola de limpieza de otro worker): en ese caso se invalida la entrada
+    y se responde 404, sin haber enviado todavía la cabecera del 200.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            "http.response.pathsend" in scope.get("extensions", {})
+            and scope["method"] == "GET"
+            and not any(name == b"range" for name, _ in scope["headers"])
+            and self.stat_result is not None
+        ):
+            # El servidor abre el archivo después de la cabecera: se comprueba antes
+            if not await anyio.Path(self.path).is_file():
+                await self._not_found(scope, receive, send)
+                return
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+
+        # La cabecera se retiene hasta el primer bloque, que ya implica haber abierto el archivo
+        start_message: Message | None = None
+        body_started = False
+
+        async def deferred_send(message: Message) -> None:
+            nonlocal start_message, body_started
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if not body_started:
+                body_started = True
+                await send(start_message)
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, deferred_send)
+        except FileNotFoundError:
+            if body_started:
+                raise
+            await self._not_found(scope, receive, send)
+
+    async def _not_found(self, scope: Scope, receive: Receive, send: Send) -> None:
+        media_index.invalidate(Path(self.path))
+        await JSONResponse({"detail": "Archivo no encontrado"}, status_code=404)(scope, receive, send)
+
+
+def _etag(path: Path, stat_result: os.stat_result, immutable: bool) -> str:
+    # En el almacén por contenido el nombre ya identifica los bytes de forma única
+    if immutable and is_content_key(path.name):
+        return f'"{path.name}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _stat_file(path: Path, immutable: bool = True) -> tuple[os.stat_result, str] | None:
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    return stat_result, _etag(path, stat_result, immutable)
+
+
+def _lookup(path: Path) -> tuple[os.stat_result, str] | None:
+    entry = media_index.get(path)
+    if entry is None:
+        entry = _stat_file(path)
+        if entry is not None:
+            media_index.set(path, entry)
+    return entry
+
+
+def _serve(
+    request: Request,
+    path: Path,
+    entry: tuple[os.stat_result, str],
+    cache_control: str,
+    media_type: str | None = None,
+    vary: bool = False,
+) -> Response:
+    stat_result, etag = entry
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        # La respuesta depende de la cabecera Accept
+        headers["Vary"] = "Accept"
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return MediaFileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+async def _redirect(filename: str, size: int | None, accept: str) -> Response:
+    """Redirige a la URL del almacenamiento remoto, que es quien sirve los bytes"""
+    storage = get_storage()
+    candidates = []
+    if size is not None:
+        variant_size = closest_variant_size(size)
+        if variant_size is not None:
+            candidates = [variant_filename(filename, variant_size, fmt) for fmt in accepted_variant_formats(accept)]
+    for name in candidates + [filename]:
+        if await storage.exists(name):
+            headers = {"Cache-Control": REDIRECT_CACHE_CONTROL}
+            if size is not None:
+                headers["Vary"] = "Accept"
+            return RedirectResponse(await storage.download_url(name), status_code=302, headers=headers)
+    raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+
+@router.put("/uploads/{token}", status_code=204)
+async def receive_upload(token: str, request: Request):
+    """
+    Destino de las subidas directas con el almacenamiento local (ver LocalStorageBackend):
+    el token firmado hace de credencial, igual que una URL prefirmada de S3.
+    """
+    storage = get_storage()
+    if not storage.is_local:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    try:
+        path, content_type, max_bytes = storage.verify_upload_token(token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.headers.get("content-type") != content_type:
+        raise HTTPException(status_code=400, detail="El tipo de contenido no coincide con el firmado")
+    try:
+        await storage.receive_upload(path, request.stream(), max_bytes)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return Response(status_code=204)
+
+
+@router.api_route("/{filename}", methods=["GET", "HEAD"])
+async def get_media(
+    filename: str,
+    request: Request,
+    size: int | None = Query(None, ge=1, description="Lado mayor deseado en píxeles"),
+):
+    """
+    Sirve una imagen de media. Con 'size' devuelve la variante más pequeña que cubra
+    ese tamaño en el mejor formato que acepte el cliente, o el original si no existe.
+    Soporta ETag/If-None-Match y peticiones por rangos.
+    """
+    # Solo nombres de archivo simples, sin rutas
+    if Path(filename).name != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    if not get_storage().is_local:
+        return await _redirect(filename, size, request.headers.get("accept", ""))
+
+    vary = size is not None
+    if size is not None:
+        variant_size = closest_variant_size(size)
+        if variant_size is not None:
+            for fmt in accepted_variant_formats(request.headers.get("accept", "")):
+                candidate = media_path(variant_filename(filename, variant_size, fmt))
+                entry = _lookup(candidate)
+                if entry is not None:
+                    return _serve(request, candidate, entry, IMMUTABLE_CACHE_CONTROL, VARIANT_FORMATS[fmt], vary)
+
+    path = media_path(filename)
+    entry = _lookup(path)
+    if entry is not None:
+        return _serve(request, path, entry, IMMUTABLE_CACHE_CONTROL, vary=vary)
+
+    # Original aceptado que aún se está optimizando en segundo plano (no se indexa)
+    if is_content_key(filename):
+        path = pending_path(filename)
+        entry = _stat_file(path, immutable=False)
+        if entry is not None:
+            return _serve(request, path, entry, PENDING_CACHE_CONTROL, vary=vary)
+
+    raise HTTPException(status_code=404, detail="Archivo no encontrado")
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import PROCESS_RESIDENT_MEMORY, render_metrics
+from app.core.startup import current_rss_bytes
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    PROCESS_RESIDENT_MEMORY.set(current_rss_bytes())
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
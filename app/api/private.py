@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends
-from app.auth.auth import get_current_user
-from app.models.user import UserBase
+from fastapi import APIRouter, Depends, Request
+from app.auth.auth import get_current_user_stateless
+from app.models.user import UserBase, UserSnapshot
+from app.core.responses import etag_matches, not_modified, trusted_response, weak_etag
 
 router = APIRouter()
 
 @router.get("/me", response_model=UserBase)
-def read_current_user(current_user: UserBase = Depends(get_current_user)):
+async def read_current_user(request: Request, current_user: UserSnapshot = Depends(get_current_user_stateless)):
     """
     Endpoint protegido que devuelve la información del usuario autenticado.
     Para acceder, debes incluir el token JWT en el header 'Authorization'
     en el formato 'Bearer <token>'.
     """
-    return current_user
\ No newline at end of file
+    # El ETag sale de la versión de la instantánea, sin consultar la base de datos
+    headers = {"ETag": weak_etag("u", current_user.id, current_user.version), "Cache-Control": "private, no-cache"}
+    if etag_matches(request, headers["ETag"]):
+        return not_modified(headers)
+    # La instantánea trae también id y versión: solo se envían los campos de UserBase
+    return trusted_response(current_user, include=set(UserBase.model_fields), headers=headers)
\ No newline at end of file
@@ -1,19 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
 from fastapi.encoders import jsonable_encoder
 import shutil
+import uuid
 
 from app.models.user import (
     Profile, ProfileCreate, ProfileRead, ProfileUpdate, 
-    ProfileFormData, User, UserInfo
+    ProfileFormData, ProfileBatch, ProfileBatchRequest, UserInfo
 )
-from app.db.database import get_session
-from app.auth.auth import get_current_user
-from app.utils.image_handler import save_image, delete_image
+from app.db.database import get_async_session, get_read_session
+from app.auth.auth import get_current_user, get_current_user_stateless
+from app.schemas.media import ImageUploadComplete, ImageUploadRequest, ImageUploadTicket
+from app.storage import UploadNotFound, UploadTooLarge, get_storage
+from app.utils.image_handler import ALLOWED_CONTENT_TYPES, save_image, save_uploaded_image, ImageTooLargeError
+from app.utils.media_store import release_media, media_key, media_url, upload_path
+from app.services.change_feed import PROFILE_CREATED, PROFILE_UPDATED, change_feed
+from app.services.media_cleanup import media_cleanup
+from app.services.search import reindex_user
+from app.services.profiles import (
+    build_profile_read, get_profile_etag, get_profile_read, get_profile_read_with_etag, get_profile_reads,
+    invalidate_profile,
+)
+from app.core.config import (
+    CHANGE_FEED_MAX_IDS, CHANGE_FEED_RETRY_MS, IMAGE_MAX_BYTES, MEDIA_UPLOAD_URL_EXPIRES, PROFILE_BATCH_MAX_IDS,
+)
+from app.core.responses import etag_matches, not_modified, trusted_response
 
 router = APIRouter()
 
+
+async def _set_profile_image(session: AsyncSession, db_profile: Profile, image_path: str) -> bool:
+    """
+    Cambia la imagen del perfil dentro de la transacción del llamador (save_image ya
+    registró la referencia a la nueva). Devuelve True si la anterior ha quedado encolada
+    para borrarla (hay que avisar a media_cleanup tras el commit).
+    """
+    # Soltar la imagen anterior; si nadie más la usa queda encolada para borrarla
+    image_released = False
+    if db_profile.image_url:
+        image_released = await release_media(session, media_key(db_profile.image_url))
+    db_profile.image_url = media_url(media_key(image_path))
+    return image_released
+
+
 @router.post("/")
 async def create_profile(
     bio: str = Form(None),
@@ -21,12 +54,13 @@ async def create_profile(
     website: str = Form(None),
     image: UploadFile = File(None),
     current_user = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    # Verificar si el usuario ya tiene un perfil
-    existing_profile = session.exec(
+    # Comprobación rápida (por índice) para no procesar la imagen en vano;
+    # el índice único de user_id es quien garantiza un solo perfil por usuario
+    existing_profile = (await session.exec(
         select(Profile).where(Profile.user_id == current_user.id)
-    ).first()
+    )).first()
     
     if existing_profile:
         raise HTTPException(
@@ -38,7 +72,9 @@ async def create_profile(
     image_path = None
     if image:
         try:
-            image_path = await save_image(image)
+            image_path = await save_image(image, session)
+        except ImageTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
     
@@ -48,62 +84,65 @@ async def create_profile(
         bio=bio,
         location=location,
         website=website,
-        image_url=f"http://127.0.0.1:8000/{image_path}",
+        image_url=media_url(media_key(image_path)),
         user_id=current_user.id
     )
     
     session.add(db_profile)
-    session.commit()
-    session.refresh(db_profile)
+    try:
+        await reindex_user(session, current_user.id)
+        await session.commit()
+    except IntegrityError:
+        # Otra petición creó el perfil a la vez
+        await session.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="El usuario ya tiene un perfil"
+        )
+    await session.refresh(db_profile)
+    invalidate_profile(current_user.id)
+    await change_feed.publish(PROFILE_CREATED, current_user.id)
     return db_profile
 
 
 @router.get("/me/form", response_model=ProfileFormData)
-def get_profile_form_data(
-    current_user = Depends(get_current_user),
-    session: Session = Depends(get_session)
+async def get_profile_form_data(
+    current_user = Depends(get_current_user_stateless),
+    session: AsyncSession = Depends(get_read_session)
 ):
     """Obtener los datos actuales del perfil para el formulario de edición"""
-    profile = session.exec(
-        select(Profile).where(Profile.user_id == current_user.id)
-    ).first()
+    profile = await get_profile_read(session, current_user.id)
     
     if not profile:
         # Si no existe el perfil, devolver solo los datos del usuario
-        return ProfileFormData(
+        return trusted_response(ProfileFormData.model_construct(
             bio=None,
             image_url=None,
             location=None,
             website=None,
-            user_info=UserInfo(
+            user_info=UserInfo.model_construct(
                 username=current_user.username,
                 email=current_user.email,
                 full_name=current_user.full_name
             )
-        )
+        ))
     
-    # Si existe el perfil, devolver todos los datos
-    return ProfileFormData(
+    # Si existe el perfil, devolver todos los datos (ya validados al construir ProfileRead)
+    return trusted_response(ProfileFormData.model_construct(
         bio=profile.bio,
         image_url=profile.image_url, 
         location=profile.location,
         website=profile.website,
-        user_info=UserInfo(
-            username=current_user.username,
-            email=current_user.email,
-            full_name=current_user.full_name
-        )
-    )
+        user_info=profile.user
+    ))
 
 @router.get("/me", response_model=ProfileRead)
-def get_my_profile(
-    current_user = Depends(get_current_user),
-    session: Session = Depends(get_session)
+async def get_my_profile(
+    current_user = Depends(get_current_user_stateless),
+    session: AsyncSession = Depends(get_read_session)
 ):
     """Obtener el perfil completo con datos del usuario"""
-    profile = session.exec(
-        select(Profile).where(Profile.user_id == current_user.id)
-    ).first()
+    profile = await get_profile_read(session, current_user.id)
     
     if not profile:
         raise HTTPException(
@@ -111,22 +150,7 @@ def get_my_profile(
             detail="Perfil no encontrado"
         )
     
-    # Agregar información del usuario al perfil
-    user_info = UserInfo(
-        username=current_user.username,
-        email=current_user.email,
-        full_name=current_user.full_name
-    )
-    
-    return ProfileRead(
-        id=profile.id,
-        user_id=profile.user_id,
-        bio=profile.bio,
-        image_url=profile.image_url,
-        location=profile.location,
-        website=profile.website,
-        user=user_info
-    )
+    return trusted_response(profile)
 
 
 @router.patch("/me", response_model=ProfileRead)
@@ -136,11 +160,11 @@ async def update_my_profile(
     website: str = Form(None),
     image: UploadFile = File(None),
     current_user = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    db_profile = session.exec(
+    db_profile = (await session.exec(
         select(Profile).where(Profile.user_id == current_user.id)
-    ).first()
+    )).first()
     
     if not db_profile:
         raise HTTPException(
@@ -149,82 +173,184 @@ async def update_my_profile(
         )
     
     # Procesar la imagen solo si se proporciona una nueva
+    image_released = False
+    changed = []
     if image and image.filename:
         try:
-            # Eliminar la imagen anterior si existe
-            if db_profile.image_url:
-                await delete_image(db_profile.image_url)
-            # Guardar la nueva imagen
-            image_path = await save_image(image)
-            db_profile.image_url = image_path
+            # Guardar la nueva imagen (se valida antes de tocar la anterior)
+            image_path = await save_image(image, session)
+        except ImageTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
+        image_released = await _set_profile_image(session, db_profile, image_path)
+        changed.append("image_url")
 
     # Actualizar solo los campos que se proporcionaron
     if bio is not None and bio.strip():  # Actualizar solo si no está vacío
         db_profile.bio = bio
+        changed.append("bio")
     if location is not None and location.strip():
         db_profile.location = location
+        changed.append("location")
     if website is not None and website.strip():
         db_profile.website = website
+        changed.append("website")
+    db_profile.version += 1
     
     session.add(db_profile)
-    session.commit()
-    session.refresh(db_profile)
+    await reindex_user(session, current_user.id)
+    await session.commit()
+    await session.refresh(db_profile)
+    invalidate_profile(current_user.id)
+    if image_released:
+        media_cleanup.notify()
+    await change_feed.publish(PROFILE_UPDATED, current_user.id, changed)
     
     # Incluir información del usuario en la respuesta
-    return ProfileRead(
-        id=db_profile.id,
-        user_id=db_profile.user_id,
-        bio=db_profile.bio,
-        image_url=db_profile.image_url,
-        location=db_profile.location,
-        website=db_profile.website,
-        user=UserInfo(
-            username=current_user.username,
-            email=current_user.email,
-            full_name=current_user.full_name
+    return trusted_response(build_profile_read(db_profile, current_user))
+
+
+@router.post("/me/image/upload-url", response_model=ImageUploadTicket)
+async def create_image_upload_url(
+    data: ImageUploadRequest,
+    current_user = Depends(get_current_user_stateless),
+):
+    """
+    URL firmada para subir la imagen del perfil directamente al almacenamiento, sin
+    pasar los bytes por la API. Al terminar, el cliente llama a /me/image/complete.
+    """
+    if data.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="Tipo de archivo no permitido")
+    if data.size > IMAGE_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La imagen supera el máximo de {IMAGE_MAX_BYTES} bytes"
         )
+    upload_id = uuid.uuid4().hex
+    upload = await get_storage().presign_upload(
+        upload_path(current_user.id, upload_id), data.content_type, IMAGE_MAX_BYTES, MEDIA_UPLOAD_URL_EXPIRES
+    )
+    return ImageUploadTicket(
+        upload_id=upload_id,
+        method=upload.method,
+        url=upload.url,
+        fields=upload.fields,
+        headers=upload.headers,
+        expires_in=MEDIA_UPLOAD_URL_EXPIRES,
     )
 
 
-@router.get("/{user_id}", response_model=ProfileRead)
-def get_user_profile(
-    user_id: int,
-    session: Session = Depends(get_session)
+@router.post("/me/image/complete", response_model=ProfileRead)
+async def complete_image_upload(
+    data: ImageUploadComplete,
+    current_user = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session)
 ):
-    """Obtener el perfil de cualquier usuario con sus datos"""
-    profile = session.exec(
-        select(Profile).where(Profile.user_id == user_id)
-    ).first()
-    
-    if not profile:
+    """Valida y procesa una subida directa y la pone como imagen del perfil"""
+    db_profile = (await session.exec(
+        select(Profile).where(Profile.user_id == current_user.id)
+    )).first()
+
+    if not db_profile:
         raise HTTPException(
             status_code=404,
             detail="Perfil no encontrado"
         )
+
+    try:
+        image_path = await save_uploaded_image(upload_path(current_user.id, data.upload_id), session)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    except (ImageTooLargeError, UploadTooLarge) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    image_released = await _set_profile_image(session, db_profile, image_path)
+    db_profile.version += 1
+    session.add(db_profile)
+    await session.commit()
+    await session.refresh(db_profile)
+    invalidate_profile(current_user.id)
+    if image_released:
+        media_cleanup.notify()
+    await change_feed.publish(PROFILE_UPDATED, current_user.id, ["image_url"])
+
+    return trusted_response(build_profile_read(db_profile, current_user))
+
+
+@router.post("/batch", response_model=ProfileBatch)
+async def get_profiles_batch(
+    data: ProfileBatchRequest,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Perfiles de varios usuarios en una sola petición (listados de miembros, feeds)"""
+    # Sin duplicados y en el orden pedido
+    user_ids = list(dict.fromkeys(data.user_ids))
+    if len(user_ids) > PROFILE_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se admiten como máximo {PROFILE_BATCH_MAX_IDS} ids por petición"
+        )
+    profiles = await get_profile_reads(session, user_ids)
+    return trusted_response(ProfileBatch(profiles=profiles))
+
+
+@router.get("/events")
+async def profile_events(
+    request: Request,
+    user_ids: list[int] = Query(..., description="Usuarios cuyos cambios se quieren recibir"),
+):
+    """
+    Feed de cambios (Server-Sent Events) de los perfiles de los usuarios indicados, en
+    lugar de sondear GET /profiles/{user_id}. Cada evento solo dice qué usuario cambió y
+    qué campos; el cliente pide el perfil de nuevo (con If-None-Match) si lo necesita.
+    Tipos: profile.created, profile.updated, user.updated, user.deleted y resync (el
+    cliente se quedó atrás o acaba de reconectar y debe volver a pedir todos los
+    perfiles que sigue). El servidor cierra cada conexión pasado un tiempo y el
+    navegador reconecta solo.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > CHANGE_FEED_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se admiten como máximo {CHANGE_FEED_MAX_IDS} ids por conexión"
+        )
+    if change_feed.is_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiadas conexiones abiertas al feed de cambios",
+            headers={"Retry-After": str(max(1, CHANGE_FEED_RETRY_MS // 1000))}
+        )
+    return StreamingResponse(
+        change_feed.stream(user_ids, reconnected="last-event-id" in request.headers),
+        media_type="text/event-stream",
+        # Sin caché ni buffering en proxies (X-Accel-Buffering lo entiende nginx)
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{user_id}", response_model=ProfileRead)
+async def get_user_profile(
+    user_id: int,
+    request: Request,
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Obtener el perfil de cualquier usuario con sus datos (admite If-None-Match)"""
+    if request.headers.get("if-none-match"):
+        # Validación condicional: basta con las versiones, sin cargar ni serializar el perfil
+        etag = await get_profile_etag(session, user_id)
+        if etag is not None and etag_matches(request, etag):
+            return not_modified({"ETag": etag, "Cache-Control": "no-cache"})
+
+    cached = await get_profile_read_with_etag(session, user_id)
     
-    # Obtener el usuario asociado al perfil
-    user = session.get(User, user_id)
-    if not user:
+    if not cached:
         raise HTTPException(
             status_code=404,
-            detail="Usuario no encontrado"
+            detail="Perfil no encontrado"
         )
     
-    # Agregar información del usuario al perfil
-    user_info = UserInfo(
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name
-    )
-    
-    return ProfileRead(
-        id=profile.id,
-        user_id=profile.user_id,
-        bio=profile.bio,
-        image_url=profile.image_url,
-        location=profile.location,
-        website=profile.website,
-        user=user_info
-    ) 
\ No newline at end of file
+    profile, etag = cached
+    return trusted_response(profile, headers={"ETag": etag, "Cache-Control": "no-cache"})
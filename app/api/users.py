@@ -1,25 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional
 
-from app.models.user import User, UserCreate, UserRead, UserUpdate, Profile
-from app.db.database import get_session
-from app.core.security import get_password_hash  # importa la función
-from app.auth.auth import get_current_user
-from app.utils.image_handler import delete_image
+from app.models.user import (
+    User, UserCreate, UserRead, UserPage, UserSearchPage, UserSnapshot, UserUpdate,
+)
+from app.db.database import async_read_engine, get_async_session, get_read_session
+from app.core.config import USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.core.security import hash_password_async
+from app.auth.auth import (
+    get_current_user, get_current_user_stateless, get_token_payload, invalidate_user, require_admin_key, revoke_token,
+)
+from app.utils.media_store import release_media, media_key
+from app.services.change_feed import USER_DELETED, USER_UPDATED, change_feed
+from app.services.media_cleanup import media_cleanup
+from app.services.profiles import invalidate_profile
+from app.services.search import reindex_user, search_enabled, search_users, unindex_user
+from app.services.user_bulk import (
+    EXPORT_MEDIA_TYPES, export_users, import_users, iter_lines, iter_user_batches, parse_rows,
+)
+from app.schemas.user_import import UserImportReport
+from app.core.responses import etag_matches, not_modified, trusted_response, weak_etag
 
 router = APIRouter()
 
 
 @router.post("/", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, session: Session = Depends(get_session)):
-    # Verificamos si el email o username ya existe
-    statement = select(User).where((User.email == user.email) | (User.username == user.username))
-    existing_user = session.exec(statement).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="El usuario ya existe")
-
-    hashed_pw = get_password_hash(user.password)
+async def create_user(user: UserCreate, session: AsyncSession = Depends(get_async_session)):
+    hashed_pw = await hash_password_async(user.password)
     db_user = User(
     username=user.username,
     email=user.email,
@@ -30,101 +43,207 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
 )
 
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    try:
+        # Los índices únicos de email y username detectan los duplicados (al hacer flush)
+        await session.flush()
+        await reindex_user(session, db_user.id)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail="El usuario ya existe")
+    await session.refresh(db_user)
     return db_user
 
 
-@router.get("/", response_model=list[UserRead])
-def list_users(session: Session = Depends(get_session)):
-    users = session.exec(select(User)).all()
-    return users
+async def _iter_users_ndjson(after_id: int):
+    """Genera los usuarios en NDJSON leyendo el cursor del servidor por lotes"""
+    # La sesión de la dependencia se cierra antes de enviar la respuesta,
+    # así que el streaming abre la suya propia.
+    async with AsyncSession(async_read_engine) as session:
+        async for batch in iter_user_batches(session, after_id):
+            yield "".join(UserRead.model_validate(user).model_dump_json() + "\n" for user in batch)
+
+
+@router.get("/", response_model=UserPage)
+async def list_users(
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    after: str | None = Query(None, description="Cursor devuelto en 'next_cursor' de la página anterior"),
+    stream: bool = Query(False, description="Devolver todos los usuarios a partir del cursor en NDJSON"),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Listar usuarios paginando por id (keyset) o en streaming NDJSON"""
+    try:
+        after_id = decode_cursor(after) if after else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        return StreamingResponse(_iter_users_ndjson(after_id), media_type="application/x-ndjson")
+
+    # Pedimos una fila de más para saber si existe una página siguiente
+    users = (await session.exec(
+        select(User).where(User.id > after_id).order_by(User.id).limit(limit + 1)
+    )).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].id)
+    return trusted_response(UserPage(items=users, next_cursor=next_cursor))
+
+
+@router.get("/search", response_model=UserSearchPage)
+async def search_users_endpoint(
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras o prefijos a buscar"),
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, description="Valor de 'next_offset' de la página anterior"),
+    session: AsyncSession = Depends(get_read_session)
+):
+    """Buscar usuarios por username, nombre, email, bio o ubicación, por relevancia"""
+    if not await search_enabled(session):
+        raise HTTPException(status_code=503, detail="La búsqueda no está disponible")
+    return trusted_response(await search_users(session, q, limit, offset))
+
+
+# Tipos de contenido aceptados por la importación
+IMPORT_CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+
+@router.post("/import", response_model=UserImportReport, dependencies=[Depends(require_admin_key)])
+async def import_users_endpoint(request: Request, session: AsyncSession = Depends(get_async_session)):
+    """
+    Alta masiva de usuarios desde un cuerpo NDJSON o CSV (columnas username, email,
+    password, full_name, is_active). El cuerpo se procesa en streaming, por lotes;
+    las filas inválidas o duplicadas se devuelven en el informe con su número de línea.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Usa application/x-ndjson o text/csv",
+        )
+    return await import_users(session, parse_rows(fmt, iter_lines(request.stream())))
+
+
+async def _iter_export(fmt: str):
+    async with AsyncSession(async_read_engine) as session:
+        async for chunk in export_users(session, fmt):
+            yield chunk
+
+
+@router.get("/export", dependencies=[Depends(require_admin_key)])
+async def export_users_endpoint(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Exporta todos los usuarios (sin contraseñas) en streaming"""
+    return StreamingResponse(_iter_export(format), media_type=EXPORT_MEDIA_TYPES[format])
 
 
 @router.get("/{user_id}", response_model=UserRead)
-def get_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+async def get_user(user_id: int, request: Request, session: AsyncSession = Depends(get_read_session)):
+    if request.headers.get("if-none-match"):
+        # Validación condicional: solo se lee la versión de la fila
+        version = (await session.exec(select(User.version).where(User.id == user_id))).first()
+        if version is not None:
+            etag = weak_etag("u", user_id, version)
+            if etag_matches(request, etag):
+                return not_modified({"ETag": etag, "Cache-Control": "no-cache"})
+
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    return user
+    headers = {"ETag": weak_etag("u", user.id, user.version), "Cache-Control": "no-cache"}
+    return trusted_response(UserRead.model_validate(user), headers=headers)
 
 @router.patch("/me", response_model=UserRead)
-def update_current_user(
+async def update_current_user(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    current_user: UserSnapshot = Depends(get_current_user),
+    token: dict = Depends(get_token_payload),
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Actualizar datos del usuario actual"""
-    # Verificar si el email o username ya existe (si se están actualizando)
-    if user_update.email or user_update.username:
-        statement = select(User).where(
-            (User.id != current_user.id) &  # Excluir el usuario actual
-            ((User.email == user_update.email) | (User.username == user_update.username))
-        )
-        existing_user = session.exec(statement).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="El email o username ya está en uso"
-            )
-
     # Actualizar solo los campos proporcionados
     update_data = user_update.dict(exclude_unset=True)
     
     # Si se proporciona una nueva contraseña, hashearla
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await hash_password_async(update_data.pop("password"))
     
+    db_user = await session.get(User, current_user.id)
     for key, value in update_data.items():
-        setattr(current_user, key, value)
+        setattr(db_user, key, value)
+    db_user.version += 1
     
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    session.add(db_user)
+    try:
+        # Un email o username ya en uso por otro usuario viola el índice único
+        await reindex_user(session, db_user.id)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="El email o username ya está en uso"
+        )
+    await session.refresh(db_user)
+    invalidate_user(db_user.id)
+    # El perfil público incluye username, email y nombre
+    invalidate_profile(db_user.id)
+    if update_data.get("is_active") is False:
+        # Con TOKEN_EMBED_CLAIMS el token seguiría diciendo is_active=True hasta caducar
+        await revoke_token(token)
+    # Solo los nombres de los campos; la contraseña no se anuncia
+    await change_feed.publish(USER_UPDATED, db_user.id, [k for k in update_data if k != "hashed_password"])
     
-    return current_user
+    return db_user
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_current_user(
-    current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session)
+    current_user: UserSnapshot = Depends(get_current_user),
+    token: dict = Depends(get_token_payload),
+    session: AsyncSession = Depends(get_async_session)
 ):
     """Eliminar el usuario actual y su perfil"""
     try:
-        # Primero, eliminar el perfil si existe
-        profile = session.exec(
-            select(Profile).where(Profile.user_id == current_user.id)
-        ).first()
-        
-        if profile:
-            try:
-                # Si el perfil tiene una imagen, eliminarla
-                if profile.image_url:
-                    await delete_image(profile.image_url)
-            except Exception as e:
-                # Si hay un error al eliminar la imagen, lo registramos pero continuamos
-                print(f"Error al eliminar la imagen: {str(e)}")
-            
-            # Eliminar el perfil
-            session.delete(profile)
-            session.commit()  # Commit separado para el perfil
-        
-        # Eliminar el usuario
-        session.delete(current_user)
-        session.commit()
+        # Usuario y perfil en una sola consulta; el perfil se borra en cascada
+        user = (await session.exec(
+            select(User).where(User.id == current_user.id).options(selectinload(User.profile))
+        )).one()
+
+        image_released = False
+        if user.profile and user.profile.image_url:
+            # Soltar la imagen del perfil; si nadie más la usa queda encolada para borrarla
+            image_released = await release_media(session, media_key(user.profile.image_url))
+
+        # Una sola transacción: o se borra todo o no se borra nada
+        await session.delete(user)
+        await unindex_user(session, user.id)
+        await session.commit()
+        invalidate_user(current_user.id)
+        invalidate_profile(current_user.id)
+        # El token y su sesión dejan de valer (con TOKEN_EMBED_CLAIMS no se consulta la base de datos)
+        await revoke_token(token)
+
+        # Los archivos se borran en segundo plano, fuera de la petición
+        if image_released:
+            media_cleanup.notify()
+        await change_feed.publish(USER_DELETED, current_user.id)
         
         return None
         
     except Exception as e:
-        session.rollback()  # Revertir cambios en caso de error
+        await session.rollback()  # Revertir cambios en caso de error
         raise HTTPException(
             status_code=500,
             detail=f"Error al eliminar el usuario: {str(e)}"
         )
 
 @router.get("/me", response_model=UserRead)
-def read_current_user(
-    current_user: User = Depends(get_current_user)
+async def read_current_user(
+    current_user: UserSnapshot = Depends(get_current_user_stateless)
 ):
     """Obtener datos del usuario actual"""
     return current_user
\ No newline at end of file
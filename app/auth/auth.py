@@ -1,54 +1,252 @@
 from datetime import datetime, timedelta
+import secrets
+import uuid
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from sqlmodel import Session
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Annotated
 
-from app.models.user import User
-from app.db.database import get_session
+from app.models.user import User, UserSnapshot
+from app.db.database import async_read_engine
+from app.core.cache import TTLCache
+from app.auth.denylist import get_token_denylist
+from app.core.config import (
+    USER_CACHE_SIZE, USER_CACHE_TTL, TOKEN_EMBED_CLAIMS, ADMIN_API_KEY,
+    JWT_SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS,
+)
 
 # Configuración del token JWT
-SECRET_KEY = "super-secret-key"  # Asegúrate de almacenarlo en variables de entorno en producción.
+SECRET_KEY = JWT_SECRET_KEY  # Asegúrate de definir JWT_SECRET_KEY en producción.
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1
+# python-jose (y su backend criptográfico) se importa al emitir o validar el primer
+# token, no al arrancar el worker
 
 # Usamos HTTPBearer en lugar de OAuth2PasswordBearer para permitir el ingreso manual del token.
 bearer_scheme = HTTPBearer()
+# Clave de administración para las operaciones masivas (importación y exportación)
+admin_key_scheme = APIKeyHeader(name="X-Admin-Key", auto_error=False)
+
+# Instantáneas de usuarios autenticados por id, para no consultar la base de datos en cada petición.
+# La caché es local a cada proceso: la invalidación explícita solo afecta al worker que
+# atendió la modificación y el TTL acota cuánto tiempo pueden quedar datos obsoletos en el resto.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
-    credentials: Annotated[HTTPAuthorizationCredentials, Depends(bearer_scheme)],
-    session: Annotated[Session, Depends(get_session)]
-) -> User:
-    token = credentials.credentials
+
+def create_refresh_token(user_id: int, family: str) -> str:
+    """
+    Refresh token de larga duración. Todos los tokens emitidos desde un mismo login
+    comparten 'fam', así se pueden revocar juntos al cerrar sesión o si se detecta
+    que un refresh token ya usado se vuelve a presentar.
+    """
+    from jose import jwt
+
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": str(user_id), "fam": family, "exp": expire, "jti": uuid.uuid4().hex, "type": "refresh"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def issue_tokens(user: User | UserSnapshot, family: str | None = None) -> dict:
+    """Par de tokens de acceso y de refresco; sin 'family' se inicia una sesión nueva"""
+    family = family or uuid.uuid4().hex
+    return {
+        "access_token": create_access_token({**build_token_claims(user), "fam": family}),
+        "refresh_token": create_refresh_token(user.id, family),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+async def revoke_token(payload: dict) -> None:
+    """Revoca el token y, si pertenece a una sesión, todos los de esa sesión"""
+    denylist = get_token_denylist()
+    if "jti" in payload:
+        await denylist.add(f"jti:{payload['jti']}", payload["exp"])
+    if "fam" in payload:
+        # La sesión puede seguir renovándose hasta que caduque el último refresh token
+        family_expires = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        await denylist.add(f"fam:{payload['fam']}", family_expires.timestamp())
+
+
+async def _is_revoked(payload: dict) -> bool:
+    keys = [f"jti:{payload['jti']}"] if "jti" in payload else []
+    if "fam" in payload:
+        keys.append(f"fam:{payload['fam']}")
+    return bool(keys) and await get_token_denylist().contains_any(*keys)
+
+
+def build_token_claims(user: User | UserSnapshot) -> dict:
+    """Claims del token de acceso; con TOKEN_EMBED_CLAIMS incluye los datos del usuario"""
+    claims = {"sub": str(user.id), "ver": user.version}
+    if TOKEN_EMBED_CLAIMS:
+        claims.update(
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=user.is_active,
+        )
+    return claims
+
+
+def invalidate_user(user_id: int) -> None:
+    """Descarta la instantánea en caché tras modificar o eliminar el usuario"""
+    user_cache.invalidate(user_id)
+
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """Valida firma, caducidad y tipo del token; los tokens anteriores sin 'type' son de acceso"""
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int | None = payload.get("sub")
+        user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token inválido: falta el claim 'sub'",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-    except JWTError:
+        payload["sub"] = int(user_id)
+    except (JWTError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user = session.get(User, user_id)
-    if user is None:
+    if payload.get("type", "access") != token_type:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Tipo de token incorrecto",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+
+async def get_token_payload(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(bearer_scheme)],
+) -> dict:
+    """
+    Claims del token de acceso de la cabecera Authorization, comprobado contra la lista
+    de revocados. FastAPI lo resuelve una vez por petición aunque también lo use
+    get_current_user (p. ej. para revocar el token al borrar la cuenta).
+    """
+    payload = decode_token(credentials.credentials)
+    # Consulta en memoria: no añade ninguna ida a la base de datos
+    if await _is_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+
+async def _load_user_snapshot(user_id: int) -> UserSnapshot | None:
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    async with AsyncSession(async_read_engine) as session:
+        user = await session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.model_validate(user)
+    user_cache.set(user_id, snapshot)
+    return snapshot
+
+
+async def _resolve_user(payload: dict) -> UserSnapshot:
+    snapshot = await _load_user_snapshot(payload["sub"])
+    if snapshot is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="No se encontró el usuario correspondiente al token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
+    return snapshot
+
+
+async def get_current_user(payload: Annotated[dict, Depends(get_token_payload)]) -> UserSnapshot:
+    """
+    Devuelve la instantánea del usuario del token, desde la caché o la base de datos.
+    Los endpoints que modifican el usuario deben cargar la fila con session.get.
+    Es asíncrona para no ocupar un hilo del threadpool en cada petición autenticada.
+    """
+    return await _resolve_user(payload)
+
+
+async def get_current_user_stateless(payload: Annotated[dict, Depends(get_token_payload)]) -> UserSnapshot:
+    """
+    Variante para endpoints de solo lectura: si el token trae los datos del usuario
+    los usa directamente, sin abrir una sesión de base de datos. Por eso un usuario
+    borrado o desactivado revoca su sesión (revoke_token): la lista de revocados es
+    lo único que se consulta.
+    """
+    if not TOKEN_EMBED_CLAIMS or "username" not in payload:
+        return await _resolve_user(payload)
+
+    # Si este proceso tiene una instantánea más reciente que el token, la preferimos
+    cached = user_cache.get(payload["sub"])
+    if cached is not None and cached.version >= payload.get("ver", 0):
+        return cached
+
+    return UserSnapshot(
+        id=payload["sub"],
+        username=payload["username"],
+        email=payload["email"],
+        full_name=payload.get("full_name"),
+        is_active=payload.get("is_active", True),
+        version=payload.get("ver", 1),
+    )
+
+
+async def rotate_refresh_token(token: str) -> dict:
+    """
+    Canjea un refresh token por un par nuevo. Solo verifica la firma y la lista de
+    revocados y lee el usuario de la caché: sin bcrypt ni escrituras en la base de datos.
+    """
+    payload = decode_token(token, token_type="refresh")
+    denylist = get_token_denylist()
+    if await denylist.contains_any(f"fam:{payload.get('fam')}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión revocada",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if await denylist.contains_any(f"jti:{payload.get('jti')}"):
+        # Un refresh token ya canjeado se vuelve a usar: posible robo, se revoca toda la sesión
+        await revoke_token(payload)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token ya utilizado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Rotación: el token canjeado deja de valer
+    await denylist.add(f"jti:{payload['jti']}", payload["exp"])
+    user = await _resolve_user(payload)
+    return issue_tokens(user, family=payload["fam"])
+
+
+async def require_admin_key(
+    api_key: Annotated[str | None, Depends(admin_key_scheme)],
+) -> None:
+    """Exige la cabecera X-Admin-Key; sin ADMIN_API_KEY configurada los endpoints quedan deshabilitados"""
+    if not ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Operaciones de administración deshabilitadas",
+        )
+    if api_key is None or not secrets.compare_digest(api_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Clave de administración inválida",
+        )
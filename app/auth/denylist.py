@@ -0,0 +1,66 @@
+"""
+Lista de tokens revocados, consultada en cada petición autenticada.
+
+Las claves son 'jti:<id>' (un token concreto) o 'fam:<id>' (todos los tokens de un
+login y sus renovaciones) y solo se guardan hasta que caducaría el token, así que el
+conjunto se mantiene pequeño. El backend en memoria es local a cada proceso: con
+varios workers hay que registrar con set_token_denylist una implementación compartida
+(p. ej. sobre Redis).
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class TokenDenylist(ABC):
+    @abstractmethod
+    async def add(self, key: str, expires_at: float) -> None:
+        """Revoca la clave hasta expires_at (timestamp Unix)"""
+
+    @abstractmethod
+    async def contains_any(self, *keys: str) -> bool:
+        """True si alguna de las claves está revocada"""
+
+
+class MemoryTokenDenylist(TokenDenylist):
+    """
+    Conjunto con caducidad. Las entradas vencidas se purgan cada vez que el tamaño
+    se duplica; nunca se descarta una revocación vigente.
+    """
+
+    def __init__(self):
+        self._expires: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_purge = 1024
+
+    async def add(self, key: str, expires_at: float) -> None:
+        with self._lock:
+            self._expires[key] = max(expires_at, self._expires.get(key, 0.0))
+            if len(self._expires) >= self._next_purge:
+                now = time.time()
+                self._expires = {k: exp for k, exp in self._expires.items() if exp > now}
+                self._next_purge = max(len(self._expires) * 2, 1024)
+
+    async def contains_any(self, *keys: str) -> bool:
+        now = time.time()
+        for key in keys:
+            expires_at = self._expires.get(key)
+            if expires_at is not None and expires_at > now:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+_denylist: TokenDenylist = MemoryTokenDenylist()
+
+
+def set_token_denylist(denylist: TokenDenylist) -> None:
+    """Sustituye el almacén de revocaciones (llamar antes de arrancar)"""
+    global _denylist
+    _denylist = denylist
+
+
+def get_token_denylist() -> TokenDenylist:
+    return _denylist
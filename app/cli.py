@@ -0,0 +1,112 @@
+"""
+Comandos de administración.
+
+    python -m app.cli import-users usuarios.ndjson
+    python -m app.cli import-users usuarios.csv --format csv
+    python -m app.cli export-users --format csv > usuarios.csv
+    python -m app.cli rebuild-search
+    python -m app.cli migrate
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+import anyio
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import IMAGE_UPLOAD_CHUNK_SIZE
+from app.core.security import password_pool
+from app.db.database import async_engine, check_schema_version, create_db_and_tables, engine
+from app.db.search import rebuild_search_index
+from app.services.user_bulk import FORMATS, export_users, import_users, iter_lines, parse_rows
+
+
+async def _file_chunks(path: str):
+    if path == "-":
+        while chunk := await anyio.to_thread.run_sync(sys.stdin.buffer.read, IMAGE_UPLOAD_CHUNK_SIZE):
+            yield chunk
+        return
+    async with await anyio.open_file(path, "rb") as f:
+        while chunk := await f.read(IMAGE_UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+def _guess_format(path: str) -> str:
+    return "csv" if Path(path).suffix.lower() == ".csv" else "ndjson"
+
+
+async def _import(args: argparse.Namespace) -> int:
+    fmt = args.format or _guess_format(args.file)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        report = await import_users(session, parse_rows(fmt, iter_lines(_file_chunks(args.file))))
+    for error in report.errors:
+        print(f"línea {error.line}: {error.error}", file=sys.stderr)
+    if report.errors_truncated:
+        print("... (más errores omitidos)", file=sys.stderr)
+    print(f"Creados: {report.created}  Fallidos: {report.failed}", file=sys.stderr)
+    return 1 if report.failed else 0
+
+
+async def _export(args: argparse.Namespace) -> int:
+    async with AsyncSession(async_engine) as session:
+        async for chunk in export_users(session, args.format):
+            sys.stdout.write(chunk)
+    sys.stdout.flush()
+    return 0
+
+
+async def _rebuild_search(args: argparse.Namespace) -> int:
+    with engine.begin() as conn:
+        count = rebuild_search_index(conn)
+    if count is None:
+        print("Esta base de datos no admite FTS5: la búsqueda queda deshabilitada", file=sys.stderr)
+        return 1
+    print(f"Usuarios indexados: {count}", file=sys.stderr)
+    return 0
+
+
+async def _migrate(args: argparse.Namespace) -> int:
+    # create_db_and_tables ya se ha ejecutado en main(); aquí solo se informa
+    print(f"Esquema en la versión {await check_schema_version()}", file=sys.stderr)
+    return 0
+
+
+async def _run(args: argparse.Namespace) -> int:
+    try:
+        return await args.handler(args)
+    finally:
+        await async_engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-users", help="Importar usuarios desde NDJSON o CSV")
+    import_parser.add_argument("file", help="Archivo a importar ('-' para la entrada estándar)")
+    import_parser.add_argument("--format", choices=FORMATS, help="Por defecto según la extensión")
+    import_parser.set_defaults(handler=_import)
+
+    export_parser = commands.add_parser("export-users", help="Exportar usuarios a la salida estándar")
+    export_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    export_parser.set_defaults(handler=_export)
+
+    search_parser = commands.add_parser("rebuild-search", help="Regenerar el índice de búsqueda de usuarios")
+    search_parser.set_defaults(handler=_rebuild_search)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="Crear las tablas y aplicar las migraciones (necesario con FAST_STARTUP)"
+    )
+    migrate_parser.set_defaults(handler=_migrate)
+
+    args = parser.parse_args(argv)
+    create_db_and_tables()
+    try:
+        return asyncio.run(_run(args))
+    finally:
+        password_pool.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
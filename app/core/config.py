@@ -0,0 +1,207 @@
+# app/core/config.py
+"""Configuración de la aplicación leída desde variables de entorno."""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _env_int_list(name: str, default: str) -> list[int]:
+    return [int(item) for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Paginación del listado de usuarios
+USERS_PAGE_SIZE = _env_int("USERS_PAGE_SIZE", 50)
+USERS_MAX_PAGE_SIZE = _env_int("USERS_MAX_PAGE_SIZE", 500)
+# Filas que se leen del cursor del servidor en cada lote del modo streaming
+USERS_STREAM_BATCH_SIZE = _env_int("USERS_STREAM_BATCH_SIZE", 1000)
+
+# Hash de contraseñas
+# Coste de bcrypt; al cambiarlo, los hashes existentes se regeneran en el siguiente login
+BCRYPT_ROUNDS = _env_int("BCRYPT_ROUNDS", 12)
+# Procesos dedicados a bcrypt (0 = usar el threadpool del servidor)
+PASSWORD_HASH_WORKERS = _env_int("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+# Operaciones en cola permitidas antes de responder 503
+PASSWORD_HASH_MAX_PENDING = _env_int("PASSWORD_HASH_MAX_PENDING", 64)
+# Segundos que se indican en la cabecera Retry-After cuando el pool está saturado
+PASSWORD_HASH_RETRY_AFTER = _env_int("PASSWORD_HASH_RETRY_AFTER", 1)
+
+# Caché de usuarios autenticados (instantáneas por id)
+USER_CACHE_SIZE = _env_int("USER_CACHE_SIZE", 10000)
+USER_CACHE_TTL = _env_float("USER_CACHE_TTL", 60.0)
+# Incluir username, email, is_active y versión en el token para que los
+# endpoints de lectura puedan autenticar sin consultar la base de datos. Borrar o
+# desactivar la cuenta revoca la sesión con la que se hace, pero los tokens de acceso
+# de otras sesiones del mismo usuario siguen valiendo en esos endpoints hasta caducar
+# (ACCESS_TOKEN_EXPIRE_MINUTES); tras un borrado ya no se pueden renovar
+TOKEN_EMBED_CLAIMS = _env_bool("TOKEN_EMBED_CLAIMS", False)
+
+# Base de datos
+# URL de SQLAlchemy; por defecto el archivo db.sqlite3 en la raíz del proyecto
+DATABASE_URL = os.getenv("DATABASE_URL")
+# URL para el engine asíncrono; si no se indica se deriva de DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+# Registrar cada sentencia SQL (solo para depuración: es síncrono y muy costoso)
+DB_ECHO = _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 30.0)
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", -1)
+
+# Ajustes de SQLite que se aplican al abrir cada conexión
+SQLITE_WAL = _env_bool("SQLITE_WAL", True)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_SIZE = _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+# Valores negativos se interpretan en KiB (-65536 = 64 MiB por conexión)
+SQLITE_CACHE_SIZE = _env_int("SQLITE_CACHE_SIZE", -65536)
+# Pool de solo lectura para los endpoints GET
+DB_READ_POOL_SIZE = _env_int("DB_READ_POOL_SIZE", 10)
+# Réplica de lectura opcional para backends distintos de SQLite
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+
+# Procesamiento de imágenes
+# Procesos dedicados a PIL (0 = usar el threadpool del servidor)
+IMAGE_WORKERS = _env_int("IMAGE_WORKERS", min(2, os.cpu_count() or 1))
+IMAGE_MAX_PENDING = _env_int("IMAGE_MAX_PENDING", 16)
+IMAGE_RETRY_AFTER = _env_int("IMAGE_RETRY_AFTER", 2)
+# Aceptar la subida de inmediato y optimizar la imagen en segundo plano
+IMAGE_OPTIMIZE_IN_BACKGROUND = _env_bool("IMAGE_OPTIMIZE_IN_BACKGROUND", False)
+# Tamaño de los bloques con los que se copia la subida a disco
+IMAGE_UPLOAD_CHUNK_SIZE = _env_int("IMAGE_UPLOAD_CHUNK_SIZE", 64 * 1024)
+# Límites de las subidas de imágenes
+IMAGE_MAX_BYTES = _env_int("IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+IMAGE_MAX_PIXELS = _env_int("IMAGE_MAX_PIXELS", 25_000_000)
+# Bytes como máximo que se leen para encontrar las dimensiones en la cabecera
+IMAGE_PROBE_MAX_BYTES = _env_int("IMAGE_PROBE_MAX_BYTES", 256 * 1024)
+# Tamaño máximo del cuerpo de las peticiones con subidas (imagen + resto de campos)
+UPLOAD_MAX_REQUEST_BYTES = _env_int("UPLOAD_MAX_REQUEST_BYTES", IMAGE_MAX_BYTES + 256 * 1024)
+
+# Variantes responsive que se generan al subir cada imagen (lado mayor en píxeles)
+IMAGE_VARIANT_SIZES = sorted(_env_int_list("IMAGE_VARIANT_SIZES", "64,256,1024"))
+IMAGE_VARIANT_QUALITY = _env_int("IMAGE_VARIANT_QUALITY", 80)
+# AVIF es más compacto pero mucho más lento de codificar; requiere soporte en Pillow
+IMAGE_ENABLE_AVIF = _env_bool("IMAGE_ENABLE_AVIF", False)
+
+# Caché HTTP de /media: los archivos publicados no se reescriben nunca
+MEDIA_CACHE_MAX_AGE = _env_int("MEDIA_CACHE_MAX_AGE", 31536000)
+# Índice en memoria con los metadatos (stat, ETag) de los archivos servidos
+MEDIA_INDEX_SIZE = _env_int("MEDIA_INDEX_SIZE", 100000)
+MEDIA_INDEX_TTL = _env_float("MEDIA_INDEX_TTL", 3600.0)
+
+# Almacenamiento de media: 'local' (directorio media/) o 's3' (S3 o compatible, p. ej. MinIO)
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "local")
+# URL base pública de los archivos (CDN o bucket público); vacía = se sirven por /media
+MEDIA_PUBLIC_BASE_URL = os.getenv("MEDIA_PUBLIC_BASE_URL", "").rstrip("/")
+# Validez en segundos de las URLs firmadas de subida directa y de descarga
+MEDIA_UPLOAD_URL_EXPIRES = _env_int("MEDIA_UPLOAD_URL_EXPIRES", 900)
+MEDIA_DOWNLOAD_URL_EXPIRES = _env_int("MEDIA_DOWNLOAD_URL_EXPIRES", 3600)
+# Backend S3 (requiere boto3); las credenciales se leen de las variables estándar de AWS.
+# S3_ENDPOINT_URL apunta a un servicio compatible, también uno local para pruebas
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "media/")
+S3_REGION = os.getenv("S3_REGION") or None
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
+# Borrado de media en segundo plano (cola persistente en la tabla mediacleanup)
+# Archivos que se borran en cada lote y segundos entre revisiones de la cola
+MEDIA_CLEANUP_BATCH_SIZE = _env_int("MEDIA_CLEANUP_BATCH_SIZE", 100)
+MEDIA_CLEANUP_INTERVAL = _env_float("MEDIA_CLEANUP_INTERVAL", 30.0)
+# Espera máxima entre reintentos de un borrado fallido (crece exponencialmente)
+MEDIA_CLEANUP_MAX_BACKOFF = _env_float("MEDIA_CLEANUP_MAX_BACKOFF", 3600.0)
+# Reconciliación periódica de 'media/' con la base de datos (0 = deshabilitada). La hace
+# un solo worker por intervalo, el primero que toma el turno en la tabla mediasweeplease
+MEDIA_SWEEP_INTERVAL = _env_float("MEDIA_SWEEP_INTERVAL", 6 * 3600.0)
+# Antigüedad mínima de un archivo sin referencias para darlo por huérfano
+# (cubre las subidas cuya transacción aún no ha hecho commit)
+MEDIA_SWEEP_GRACE = _env_float("MEDIA_SWEEP_GRACE", 3600.0)
+
+# Caché de lectura de perfiles públicos (por id de usuario)
+PROFILE_CACHE_SIZE = _env_int("PROFILE_CACHE_SIZE", 10000)
+PROFILE_CACHE_TTL = _env_float("PROFILE_CACHE_TTL", 30.0)
+# Ids de usuario que se aceptan en cada petición de POST /profiles/batch
+PROFILE_BATCH_MAX_IDS = _env_int("PROFILE_BATCH_MAX_IDS", 100)
+
+# Feed de cambios de perfiles (GET /profiles/events, Server-Sent Events)
+# Ids de usuario que puede seguir cada conexión
+CHANGE_FEED_MAX_IDS = _env_int("CHANGE_FEED_MAX_IDS", 100)
+# Conexiones abiertas por worker antes de responder 503
+CHANGE_FEED_MAX_SUBSCRIBERS = _env_int("CHANGE_FEED_MAX_SUBSCRIBERS", 10000)
+# Eventos pendientes por conexión; si un cliente lento la llena se le pide que resincronice
+CHANGE_FEED_QUEUE_SIZE = _env_int("CHANGE_FEED_QUEUE_SIZE", 64)
+# Segundos entre comentarios de keep-alive, para que los proxies no cierren la conexión
+# (también es cada cuánto se cierran las conexiones que superan CHANGE_FEED_MAX_LIFETIME)
+CHANGE_FEED_KEEPALIVE = _env_float("CHANGE_FEED_KEEPALIVE", 25.0)
+# Milisegundos que espera el navegador antes de reconectar (campo 'retry' de SSE)
+CHANGE_FEED_RETRY_MS = _env_int("CHANGE_FEED_RETRY_MS", 5000)
+# Duración máxima de cada conexión; el cliente reconecta solo. Acota cuánto retrasa el
+# apagado de un worker una conexión abierta: uvicorn espera a que terminen antes del
+# evento 'shutdown' (salvo que --timeout-graceful-shutdown corte antes)
+CHANGE_FEED_MAX_LIFETIME = _env_float("CHANGE_FEED_MAX_LIFETIME", 300.0)
+
+# Importación y exportación masiva de usuarios
+# Clave de la cabecera X-Admin-Key para los endpoints de administración (vacía = deshabilitados)
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+# Filas que se validan, comprueban y se insertan en cada transacción
+USERS_IMPORT_BATCH_SIZE = _env_int("USERS_IMPORT_BATCH_SIZE", 500)
+# Contraseñas que se envían juntas a cada proceso del pool de bcrypt
+USERS_IMPORT_HASH_CHUNK = _env_int("USERS_IMPORT_HASH_CHUNK", 8)
+# Errores por fila que se incluyen en el informe (se cuentan todos)
+USERS_IMPORT_MAX_ERRORS = _env_int("USERS_IMPORT_MAX_ERRORS", 1000)
+
+# Limitación de peticiones (token bucket); rate o burst a 0 desactivan un límite
+RATE_LIMIT_ENABLED = _env_bool("RATE_LIMIT_ENABLED", True)
+# Claves (IPs, cuentas) que se recuerdan en memoria antes de expulsar las menos recientes
+RATE_LIMIT_MAX_KEYS = _env_int("RATE_LIMIT_MAX_KEYS", 100000)
+# Límite general por IP
+RATE_LIMIT_PER_SECOND = _env_float("RATE_LIMIT_PER_SECOND", 20.0)
+RATE_LIMIT_BURST = _env_int("RATE_LIMIT_BURST", 100)
+# Intentos de login por IP y por cuenta
+LOGIN_IP_PER_MINUTE = _env_float("LOGIN_IP_PER_MINUTE", 20.0)
+LOGIN_IP_BURST = _env_int("LOGIN_IP_BURST", 20)
+LOGIN_ACCOUNT_PER_MINUTE = _env_float("LOGIN_ACCOUNT_PER_MINUTE", 5.0)
+LOGIN_ACCOUNT_BURST = _env_int("LOGIN_ACCOUNT_BURST", 10)
+# Tomar la IP del cliente de X-Forwarded-For (solo detrás de un proxy de confianza)
+RATE_LIMIT_TRUST_FORWARDED = _env_bool("RATE_LIMIT_TRUST_FORWARDED", False)
+
+# Métricas de rendimiento en /metrics (formato Prometheus)
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+
+# Serialización rápida de respuestas: orjson como clase de respuesta por defecto (si está
+# instalado) y los modelos ya validados se serializan directamente, sin pasar otra vez
+# por response_model
+FAST_JSON_RESPONSES = _env_bool("FAST_JSON_RESPONSES", False)
+
+# Compresión de respuestas (gzip, y brotli si el paquete 'brotli' está instalado)
+COMPRESSION_ENABLED = _env_bool("COMPRESSION_ENABLED", True)
+# Las respuestas más pequeñas se envían sin comprimir
+COMPRESSION_MIN_SIZE = _env_int("COMPRESSION_MIN_SIZE", 1024)
+GZIP_LEVEL = _env_int("GZIP_LEVEL", 6)
+# Calidad 4: buena compresión por un coste de CPU parecido al de gzip
+BROTLI_QUALITY = _env_int("BROTLI_QUALITY", 4)
+
+# Tokens
+# Clave de firma de los JWT (cámbiala en producción)
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "super-secret-key")
+# Tokens de acceso cortos; se renuevan con el refresh token en /token/refresh, sin bcrypt
+ACCESS_TOKEN_EXPIRE_MINUTES = _env_int("ACCESS_TOKEN_EXPIRE_MINUTES", 15)
+# Refresh tokens de larga duración; cada uso devuelve uno nuevo e invalida el anterior
+REFRESH_TOKEN_EXPIRE_DAYS = _env_int("REFRESH_TOKEN_EXPIRE_DAYS", 14)
+
+# Arranque rápido de los workers: en lugar de create_all y las migraciones solo se
+# comprueba la versión del esquema (se migra antes con 'python -m app.cli migrate'),
+# y PIL, passlib y python-jose se cargan en su primer uso en vez de al arrancar
+FAST_STARTUP = _env_bool("FAST_STARTUP", False)
@@ -0,0 +1,310 @@
+# app/core/metrics.py
+"""
+Métricas de rendimiento en formato de texto de Prometheus, sin dependencias externas.
+
+MetricsMiddleware mide la latencia de cada petición por ruta (la de las respuestas en
+streaming, en un histograma aparte) y acumula, en un objeto por petición guardado en un
+ContextVar, las consultas SQL (eventos del engine) y el tiempo pasado en los pools de
+bcrypt y de imágenes. Registrar una observación es
+un par de operaciones sobre diccionarios, así que el coste en el camino caliente es mínimo.
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Límites de los histogramas de tiempos (segundos) y de número de consultas
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, *labelvalues: str) -> None:
+        self.inc(-amount, *labelvalues)
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # etiquetas -> [conteos por cubo (+Inf al final), suma, total]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(float(bound))
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Peticiones HTTP
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Peticiones en curso por ruta", ("method", "route"))
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones por ruta", ("method", "route", "status")
+)
+# Las respuestas en streaming (Server-Sent Events) duran minutos: van aparte para no
+# desvirtuar los percentiles de latencia
+HTTP_STREAM_DURATION = Histogram(
+    "http_stream_duration_seconds", "Duración de las respuestas en streaming por ruta", ("route",),
+    buckets=(1.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0),
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Sentencias SQL por petición", ("route",), buckets=COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Tiempo en la base de datos por petición", ("route",)
+)
+HTTP_REQUEST_POOL_SECONDS = Histogram(
+    "http_request_pool_seconds", "Tiempo esperando a los pools de procesos por petición", ("route", "pool")
+)
+
+# Base de datos
+DB_QUERIES = Counter("db_queries_total", "Sentencias SQL ejecutadas", ("engine",))
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Duración de las sentencias SQL", ("engine",))
+
+# Pools de procesos (bcrypt e imágenes)
+POOL_TASK_DURATION = Histogram(
+    "worker_pool_task_seconds", "Tiempo de ejecución de las tareas en el pool", ("pool",)
+)
+POOL_TASK_WAIT = Histogram(
+    "worker_pool_wait_seconds", "Tiempo de espera en cola y de envío al pool", ("pool",)
+)
+POOL_TASKS_IN_FLIGHT = Gauge("worker_pool_in_flight", "Tareas en vuelo en el pool", ("pool",))
+POOL_REJECTED = Counter("worker_pool_rejected_total", "Tareas rechazadas por pool saturado", ("pool",))
+
+# Proceso
+PROCESS_STARTUP_SECONDS = Gauge(
+    "process_startup_seconds", "Duración de cada fase del arranque del worker", ("phase",)
+)
+PROCESS_RESIDENT_MEMORY = Gauge("process_resident_memory_bytes", "Memoria residente del proceso")
+
+# Imágenes
+IMAGE_BYTES_PROCESSED = Counter("image_bytes_processed_total", "Bytes de imágenes subidas y procesadas")
+
+
+@dataclass(slots=True)
+class RequestStats:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    pool_seconds: dict[str, float] = field(default_factory=dict)
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> RequestStats | None:
+    return _request_stats.get()
+
+
+def record_pool_task(pool: str, run_seconds: float, total_seconds: float) -> None:
+    POOL_TASK_DURATION.observe(run_seconds, pool)
+    POOL_TASK_WAIT.observe(max(total_seconds - run_seconds, 0.0), pool)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_seconds[pool] = stats.pool_seconds.get(pool, 0.0) + total_seconds
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Cuenta y cronometra las sentencias SQL del engine (síncrono, o el sync_engine de uno asíncrono)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        DB_QUERIES.inc(1, name)
+        DB_QUERY_DURATION.observe(elapsed, name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+
+
+def _route_label(scope: Scope) -> str:
+    # Plantilla de la ruta ('/users/{user_id}') para no crear una serie por id
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _is_stream(message: Message) -> bool:
+    return any(
+        name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+        for name, value in message.get("headers", ())
+    )
+
+
+class _RouteInFlight:
+    """App ASGI de una ruta envuelta para contar sus peticiones en curso"""
+
+    __slots__ = ("app", "route")
+
+    def __init__(self, app: ASGIApp, route: str):
+        self.app = app
+        self.route = route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        method = scope.get("method", "")
+        HTTP_REQUESTS_IN_FLIGHT.inc(1, method, self.route)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec(1, method, self.route)
+
+
+def instrument_routes(routes: list) -> None:
+    """
+    Cuenta las peticiones en curso de cada ruta. La ruta solo se conoce después del
+    enrutado, así que se cuenta en la app de cada una y no en MetricsMiddleware, sin
+    repetir el enrutado por petición. Llamar después de incluir todos los routers.
+    """
+    for route in routes:
+        app = getattr(route, "app", None)
+        if app is not None and not isinstance(app, _RouteInFlight):
+            route.app = _RouteInFlight(app, route.path)
+
+
+class MetricsMiddleware:
+    """Registra latencia, estado y estadísticas por petición de cada ruta HTTP"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        stream = False
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status, stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                stream = _is_stream(message)
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route_label(scope)
+            if stream:
+                HTTP_STREAM_DURATION.observe(elapsed, route)
+            else:
+                HTTP_REQUEST_DURATION.observe(elapsed, scope["method"], route, str(status))
+            HTTP_REQUEST_DB_QUERIES.observe(stats.db_queries, route)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.db_seconds, route)
+            for pool, seconds in stats.pool_seconds.items():
+                HTTP_REQUEST_POOL_SECONDS.observe(seconds, route, pool)
+            _request_stats.reset(token)
+
+# Feed de cambios
+CHANGE_FEED_SUBSCRIBERS = Gauge("change_feed_subscribers", "Conexiones abiertas al feed de cambios")
+CHANGE_FEED_EVENTS = Counter("change_feed_events_total", "Eventos de cambio recibidos por el worker")
+CHANGE_FEED_OVERFLOWS = Counter(
+    "change_feed_overflows_total", "Conexiones cuya cola se llenó y tuvieron que resincronizar"
+)
@@ -0,0 +1,214 @@
+# app/core/middleware.py
+"""Middlewares ASGI de la aplicación."""
+
+import json
+import math
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.rate_limit import TokenBucketLimiter
+
+try:
+    import brotli  # Dependencia opcional
+except ImportError:
+    brotli = None
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+_TOO_LARGE_BODY = b'{"detail":"El cuerpo de la petici\\u00f3n es demasiado grande"}'
+_INVALID_LENGTH_BODY = b'{"detail":"Cabecera Content-Length inv\\u00e1lida"}'
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rechaza con 413 las peticiones cuyo cuerpo supera max_body_size.
+    Se comprueba Content-Length antes de leer nada y, si no viene, se cuentan los
+    bytes a medida que llegan para cortar la lectura en cuanto se supera el límite.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int, path_prefixes: tuple[str, ...] = ("/",)):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or not scope["path"].startswith(self.path_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                # Solo dígitos: int() también aceptaría signos, espacios y guiones bajos
+                if not value.isdigit():
+                    await self._reject(send, 400, _INVALID_LENGTH_BODY)
+                    return
+                if int(value) > self.max_body_size:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            # FastAPI convierte los errores al leer el formulario en un 400;
+            # si el motivo fue el límite de tamaño, respondemos 413 en su lugar.
+            if exceeded:
+                if message["type"] == "http.response.start":
+                    await self._reject(send)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send: Send, status: int = 413, body: bytes = _TOO_LARGE_BODY) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """
+    Aplica límites por IP antes de llegar a la aplicación. Cada regla es
+    (prefijo de ruta, limitador) y se consumen todas las que coinciden; si alguna
+    está agotada se responde 429 con Retry-After sin ejecutar el endpoint.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rules: tuple[tuple[str, TokenBucketLimiter], ...],
+        trust_forwarded: bool = False,
+    ):
+        self.app = app
+        self.rules = rules
+        self.trust_forwarded = trust_forwarded
+
+    def _client_ip(self, scope: Scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ip = self._client_ip(scope)
+        retry_after = 0.0
+        for prefix, limiter in self.rules:
+            if scope["path"].startswith(prefix):
+                retry_after = max(retry_after, await limiter.hit(ip))
+        if retry_after:
+            await self._reject(send, retry_after)
+            return
+        await self.app(scope, receive, send)
+
+    async def _reject(self, send: Send, retry_after: float) -> None:
+        body = json.dumps({"detail": "Demasiadas peticiones, inténtalo más tarde"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        # En streaming se vacía el compresor en cada bloque para no retener datos
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Comprime las respuestas de al menos minimum_size bytes con brotli (si está
+    instalado y el cliente lo acepta) o gzip. Se excluyen rutas como /media,
+    cuyas imágenes ya van comprimidas y se envían con pathsend.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        exclude_prefixes: tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.exclude_prefixes = exclude_prefixes
+
+    def _accepted(self, scope: Scope) -> set[str]:
+        accepted = set()
+        for item in Headers(scope=scope).get("accept-encoding", "").split(","):
+            coding, _, params = item.partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(coding.strip().lower())
+        return accepted
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (self.exclude_prefixes and scope["path"].startswith(self.exclude_prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        accepted = self._accepted(scope)
+        responder: ASGIApp
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif "gzip" in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)
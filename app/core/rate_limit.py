@@ -0,0 +1,115 @@
+# app/core/rate_limit.py
+"""
+Limitación de peticiones con cubos de tokens (token bucket).
+
+Cada clave (una IP, una cuenta) tiene un cubo con capacidad 'burst' que se rellena
+a 'rate' tokens por segundo; cada intento consume un token. El estado vive en un
+backend intercambiable: el de memoria es local a cada proceso, y para compartir
+los límites entre workers basta con implementar RateLimitBackend (p. ej. sobre Redis)
+y registrarlo con set_rate_limit_backend.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from app.core.config import (
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST,
+    LOGIN_IP_PER_MINUTE, LOGIN_IP_BURST, LOGIN_ACCOUNT_PER_MINUTE, LOGIN_ACCOUNT_BURST,
+)
+
+
+class RateLimitExceeded(Exception):
+    """Se lanza cuando una clave ha agotado su cubo"""
+
+    def __init__(self, limiter_name: str, retry_after: float):
+        super().__init__(f"Límite '{limiter_name}' superado")
+        self.limiter_name = limiter_name
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    async def consume(self, key: str, rate: float, burst: int) -> float:
+        """Consume un token del cubo; devuelve 0 si se permite o los segundos hasta el siguiente token"""
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Cubos en memoria con expulsión LRU al superar maxsize. Un cubo expulsado
+    vuelve a empezar lleno, así que la expulsión solo favorece a claves inactivas.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        # clave -> (tokens, instante de la última actualización)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+_backend: RateLimitBackend = MemoryRateLimitBackend(maxsize=RATE_LIMIT_MAX_KEYS)
+
+
+def set_rate_limit_backend(backend: RateLimitBackend) -> None:
+    """Sustituye el backend de todos los limitadores (llamar antes de arrancar)"""
+    global _backend
+    _backend = backend
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    return _backend
+
+
+class TokenBucketLimiter:
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    async def hit(self, key: str) -> float:
+        """Consume un token para la clave; devuelve 0 o los segundos que hay que esperar"""
+        if not self.enabled:
+            return 0.0
+        return await _backend.consume(f"{self.name}:{key}", self.rate, self.burst)
+
+    async def check(self, key: str) -> None:
+        """Como hit, pero lanza RateLimitExceeded si no quedan tokens"""
+        retry_after = await self.hit(key)
+        if retry_after:
+            raise RateLimitExceeded(self.name, retry_after)
+
+
+# Límite general por IP para todas las rutas
+ip_limiter = TokenBucketLimiter("ip", rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST)
+# Intentos de login por IP y por cuenta (se comprueban antes de tocar la base de datos o bcrypt)
+login_ip_limiter = TokenBucketLimiter("login-ip", rate=LOGIN_IP_PER_MINUTE / 60, burst=LOGIN_IP_BURST)
+login_account_limiter = TokenBucketLimiter(
+    "login-account", rate=LOGIN_ACCOUNT_PER_MINUTE / 60, burst=LOGIN_ACCOUNT_BURST
+)
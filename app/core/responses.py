@@ -0,0 +1,63 @@
+# app/core/responses.py
+"""Respuestas JSON rápidas, activadas con FAST_JSON_RESPONSES."""
+
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from app.core.config import FAST_JSON_RESPONSES
+
+try:
+    import orjson  # Dependencia opcional
+except ImportError:
+    orjson = None
+
+if FAST_JSON_RESPONSES and orjson is not None:
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+else:
+    DefaultJSONResponse = JSONResponse
+
+
+def trusted_response(
+    obj: BaseModel,
+    include: set[str] | None = None,
+    status_code: int = 200,
+    headers: dict[str, str] | None = None,
+) -> Any:
+    """
+    Respuesta para un modelo que la propia aplicación ya ha construido y validado.
+    En modo rápido se serializa a JSON con pydantic-core en un solo paso, sin la
+    segunda validación de response_model ni jsonable_encoder; si no, se devuelve
+    el objeto y FastAPI lo procesa como siempre. 'include' limita los campos
+    cuando el objeto tiene más que el modelo de respuesta declarado.
+    """
+    if FAST_JSON_RESPONSES:
+        return Response(
+            content=obj.__pydantic_serializer__.to_json(obj, include=include),
+            media_type="application/json",
+            status_code=status_code,
+            headers=headers,
+        )
+    if headers:
+        return DefaultJSONResponse(obj.model_dump(mode="json", include=include), status_code, headers)
+    return obj
+
+
+def weak_etag(*parts: Any) -> str:
+    """ETag débil a partir de ids y versiones de fila: no depende de los bytes enviados"""
+    return 'W/"' + ".".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparación débil con If-None-Match (ignora el prefijo W/)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -1,14 +1,86 @@
 # app/core/security.py
 
-from passlib.context import CryptContext
+import asyncio
+from functools import cache
 
-# bcrypt es el algoritmo que usaremos (seguro y probado)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.config import (
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_RETRY_AFTER
+)
+from app.core.workers import WorkerPool, WorkerPoolBusy
+
+
+@cache
+def get_pwd_context():
+    """
+    Contexto de passlib, creado en el primer uso: ni el servidor ni los procesos del
+    pool cargan passlib y bcrypt hasta que hace falta calcular o verificar un hash.
+    """
+    from passlib.context import CryptContext
+
+    # bcrypt es el algoritmo que usaremos (seguro y probado).
+    # Fijamos el mínimo y el máximo al coste configurado para que cualquier hash
+    # con un coste distinto se marque como desactualizado y se regenere al hacer login.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS,
+    )
+
+# Pool de procesos para bcrypt; cada proceso construye su propio pwd_context
+password_pool = WorkerPool(
+    "password",
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    retry_after=PASSWORD_HASH_RETRY_AFTER,
+)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+def get_password_hashes(passwords: list[str]) -> list[str]:
+    pwd_context = get_pwd_context()
+    return [pwd_context.hash(password) for password in passwords]
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verifica la contraseña y devuelve un hash nuevo si el actual usa otro coste"""
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Calcula el hash en el pool de procesos sin bloquear el event loop"""
+    return await password_pool.run(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Versión asíncrona de verify_and_update_password"""
+    return await password_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+
+async def hash_passwords_async(passwords: list[str], chunk_size: int) -> list[str]:
+    """
+    Calcula muchos hashes en paralelo, por trozos de chunk_size contraseñas.
+    Ocupa como mucho un trozo por proceso del pool para que los logins sigan
+    entrando entre trozo y trozo, y reintenta si el pool está saturado.
+    """
+    semaphore = asyncio.Semaphore(max(password_pool.max_workers, 1))
+
+    async def hash_chunk(chunk: list[str]) -> list[str]:
+        async with semaphore:
+            while True:
+                try:
+                    return await password_pool.run(get_password_hashes, chunk)
+                except WorkerPoolBusy as e:
+                    await asyncio.sleep(e.retry_after)
+
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    results = await asyncio.gather(*(hash_chunk(chunk) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
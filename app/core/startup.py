@@ -0,0 +1,48 @@
+# app/core/startup.py
+"""Informe de tiempo de arranque y memoria de cada worker, y precarga de dependencias pesadas."""
+
+import logging
+import os
+import resource
+import sys
+
+from app.core.metrics import PROCESS_RESIDENT_MEMORY, PROCESS_STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_bytes() -> int:
+    """Memoria residente actual (en Linux); en otros sistemas, el pico que informa getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS lo da en bytes y Linux en KiB
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def preload_heavy_modules() -> None:
+    """
+    Carga por adelantado lo que de otro modo se importa en el primer uso (PIL,
+    passlib y bcrypt, python-jose), para que la primera petición no lo pague.
+    """
+    import app.utils.image_processing  # noqa: F401
+    import jose.jwt  # noqa: F401
+    from app.core.security import get_pwd_context
+
+    get_pwd_context()
+
+
+def report_startup(import_seconds: float, startup_seconds: float) -> dict:
+    """Publica en /metrics y en el log cuánto tardó el worker en estar listo y cuánta memoria usa"""
+    rss = current_rss_bytes()
+    PROCESS_STARTUP_SECONDS.set(import_seconds, "import")
+    PROCESS_STARTUP_SECONDS.set(startup_seconds, "startup")
+    PROCESS_RESIDENT_MEMORY.set(rss)
+    logger.info(
+        "Worker %d listo en %.0f ms (importación %.0f ms, arranque %.0f ms), RSS %.1f MiB",
+        os.getpid(), (import_seconds + startup_seconds) * 1000,
+        import_seconds * 1000, startup_seconds * 1000, rss / 2**20,
+    )
+    return {"import_seconds": import_seconds, "startup_seconds": startup_seconds, "rss_bytes": rss}
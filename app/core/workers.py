@@ -0,0 +1,86 @@
+# app/core/workers.py
+"""Pools de trabajo acotados para tareas de CPU que no deben bloquear el event loop."""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable
+
+from anyio import to_thread
+
+from app.core.metrics import POOL_REJECTED, POOL_TASKS_IN_FLIGHT, record_pool_task
+
+
+class WorkerPoolBusy(Exception):
+    """Se lanza cuando la cola del pool está llena y hay que rechazar el trabajo"""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"El pool '{pool_name}' está saturado")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> tuple[float, Any]:
+    """Se ejecuta en el worker: devuelve el tiempo de ejecución junto al resultado"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+class WorkerPool:
+    """
+    Pool de procesos con un máximo de tareas en vuelo.
+    Con max_workers=0 las tareas se ejecutan en el threadpool de anyio
+    (útil en desarrollo o en despliegues de un solo núcleo).
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, retry_after: int = 1):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor: Executor | None = None
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def capacity(self) -> int:
+        """Tareas en ejecución más tareas en cola que se aceptan antes de rechazar"""
+        return max(self.max_workers, 1) + self.max_pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            # 'spawn' evita heredar hilos y conexiones abiertas del proceso del servidor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._in_flight >= self.capacity:
+            POOL_REJECTED.inc(1, self.name)
+            raise WorkerPoolBusy(self.name, self.retry_after)
+        self._in_flight += 1
+        POOL_TASKS_IN_FLIGHT.inc(1, self.name)
+        start = time.perf_counter()
+        try:
+            if self.max_workers <= 0:
+                run_seconds, result = await to_thread.run_sync(_timed, fn, *args)
+            else:
+                loop = asyncio.get_running_loop()
+                run_seconds, result = await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        finally:
+            self._in_flight -= 1
+            POOL_TASKS_IN_FLIGHT.dec(1, self.name)
+        record_pool_task(self.name, run_seconds, time.perf_counter() - start)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,6 +1,20 @@
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session 
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
 
+from app.db.migrations import LATEST_VERSION, get_schema_version, migrate
+from app.core.metrics import instrument_engine
+from app.core.config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, DB_ECHO,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SQLITE_WAL, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE,
+    DB_READ_POOL_SIZE, READ_DATABASE_URL,
+)
+
 # Nombre del archivo de base de datos SQLite
 sqlite_file_name = "db.sqlite3"
 # Obtener la ruta absoluta del directorio del proyecto
@@ -8,18 +22,146 @@ base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 # Crear la ruta completa al archivo de la base de datos
 sqlite_url = f"sqlite:///{os.path.join(base_dir, sqlite_file_name)}"
 
-# Requerido por SQLite para evitar errores en aplicaciones asincrónicas
-connect_args = {"check_same_thread": False}
+database_url = DATABASE_URL or sqlite_url
+
+# Drivers asíncronos para cada backend; otros se pueden indicar con ASYNC_DATABASE_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No hay driver asíncrono para '{backend}', define ASYNC_DATABASE_URL")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def _engine_kwargs(url: str, pool_size: int = DB_POOL_SIZE) -> dict:
+    parsed = make_url(url)
+    kwargs = {"echo": DB_ECHO}
+    if parsed.get_backend_name() == "sqlite":
+        # Requerido por SQLite para evitar errores en aplicaciones asincrónicas
+        kwargs["connect_args"] = {"check_same_thread": False}
+        # Las bases de datos en memoria usan un pool propio sin tamaño configurable
+        if parsed.database in (None, "", ":memory:"):
+            return kwargs
+    kwargs.update(
+        pool_size=pool_size,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return kwargs
+
+
+def _sqlite_pragmas(read_only: bool = False):
+    """Hook de conexión que aplica el perfil de producción de SQLite"""
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if SQLITE_WAL:
+            # WAL permite lecturas concurrentes mientras otra conexión escribe
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size={int(SQLITE_CACHE_SIZE)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return on_connect
+
+
+def _tune_engine(sync_engine, url: str, read_only: bool = False):
+    if _is_sqlite_file(url):
+        event.listen(sync_engine, "connect", _sqlite_pragmas(read_only))
 
-# Crear el engine
-engine = create_engine(sqlite_url, connect_args=connect_args, echo=True)
+
+# Engine síncrono: creación de tablas, migraciones y scripts
+engine = create_engine(database_url, **_engine_kwargs(database_url))
+_tune_engine(engine, database_url)
+
+# Engine asíncrono que usan los routers
+async_database_url = ASYNC_DATABASE_URL or _async_url(database_url)
+async_engine = create_async_engine(async_database_url, **_engine_kwargs(async_database_url))
+_tune_engine(async_engine.sync_engine, async_database_url)
+
+# Pool de solo lectura para los GET: con WAL las lecturas no esperan a los escritores.
+# En SQLite es el mismo archivo con query_only; en otros backends, READ_DATABASE_URL
+# puede apuntar a una réplica.
+if READ_DATABASE_URL:
+    async_read_url = _async_url(READ_DATABASE_URL)
+    async_read_engine = create_async_engine(async_read_url, **_engine_kwargs(async_read_url, DB_READ_POOL_SIZE))
+    _tune_engine(async_read_engine.sync_engine, async_read_url, read_only=True)
+elif _is_sqlite_file(async_database_url):
+    async_read_engine = create_async_engine(
+        async_database_url, **_engine_kwargs(async_database_url, DB_READ_POOL_SIZE)
+    )
+    _tune_engine(async_read_engine.sync_engine, async_database_url, read_only=True)
+else:
+    async_read_engine = async_engine
+
+# Número y duración de las sentencias SQL para /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "primary")
+if async_read_engine is not async_engine:
+    instrument_engine(async_read_engine.sync_engine, "read")
 
 
 def create_db_and_tables():
+    # create_all solo conoce las tablas de los modelos ya importados (la CLI no carga las rutas)
+    from app.models import media, user  # noqa: F401
+
     SQLModel.metadata.create_all(engine)
+    # Llevar las bases de datos existentes al esquema actual
+    migrate(engine)
+
+
+async def upsert_insert(session: AsyncSession):
+    """insert con ON CONFLICT (on_conflict_do_*) del dialecto de la sesión: SQLite o PostgreSQL"""
+    dialect = (await session.connection()).dialect.name
+    return postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+
+async def check_schema_version() -> int:
+    """
+    Arranque rápido: comprueba que el esquema está al día con una consulta, sin
+    create_all ni migraciones. Falla si falta alguna migración por aplicar.
+    """
+    async with async_engine.connect() as conn:
+        version = await conn.run_sync(get_schema_version)
+    if version < LATEST_VERSION:
+        raise RuntimeError(
+            f"El esquema de la base de datos está en la versión {version} y se necesita la "
+            f"{LATEST_VERSION}: ejecuta 'python -m app.cli migrate' antes de arrancar"
+        )
+    return version
 
 
 # Dependencia para obtener la sesión
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+# Dependencia para obtener una sesión asíncrona
+async def get_async_session():
+    # expire_on_commit=False evita recargas implícitas (no permitidas en modo asíncrono)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+# Dependencia para los endpoints de solo lectura
+async def get_read_session():
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
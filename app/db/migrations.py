@@ -0,0 +1,123 @@
+"""
+Migraciones versionadas del esquema.
+
+create_all crea las tablas nuevas, pero no modifica las que ya existen en un
+db.sqlite3 antiguo. Cada migración se aplica una sola vez, en orden, y la versión
+alcanzada se guarda en la tabla schema_version. Las migraciones deben ser
+idempotentes porque en una base de datos nueva create_all ya habrá creado
+parte de lo que añaden.
+"""
+from typing import Callable
+
+from sqlalchemy import Connection, Engine, inspect, text
+
+from app.db.search import rebuild_search_index
+
+
+def _add_user_version(conn: Connection) -> None:
+    columns = {c["name"] for c in inspect(conn).get_columns("user")}
+    if "version" not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+
+def _check_no_duplicates(conn: Connection, table: str, column: str) -> None:
+    duplicates = conn.execute(text(
+        f'SELECT {column}, COUNT(*) FROM "{table}" GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 5'
+    )).all()
+    if duplicates:
+        values = ", ".join(str(row[0]) for row in duplicates)
+        raise RuntimeError(
+            f"No se puede crear el índice único en {table}.{column}: hay valores duplicados ({values})"
+        )
+
+
+def _add_lookup_indexes(conn: Connection) -> None:
+    # Mismos nombres que genera SQLModel para Field(index=True, unique=True)
+    for table, column in (("user", "email"), ("user", "username"), ("profile", "user_id")):
+        _check_no_duplicates(conn, table, column)
+        conn.execute(text(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_{column} ON "{table}" ({column})'
+        ))
+
+
+def _legacy_media_url(image_url: str) -> str | None:
+    """
+    '/media/<clave>' a partir de una URL antigua, o None si no apuntaba a ninguna imagen:
+    los perfiles creados sin imagen guardaban 'http://127.0.0.1:8000/None'.
+    """
+    directory, _, key = image_url.rpartition("/")
+    if not key or key == "None" or directory.rpartition("/")[2] != "media":
+        return None
+    return f"/media/{key}"
+
+
+def _normalize_image_urls(conn: Connection) -> None:
+    # Antes se guardaba 'http://127.0.0.1:8000/media/<clave>' o 'media/<clave>' y se
+    # reescribía en cada lectura; ahora se guarda directamente '/media/<clave>'
+    rows = conn.execute(text(
+        "SELECT id, image_url FROM profile WHERE image_url IS NOT NULL AND image_url NOT LIKE '/media/%'"
+    )).all()
+    for profile_id, image_url in rows:
+        conn.execute(
+            text("UPDATE profile SET image_url = :url WHERE id = :id"),
+            {"url": _legacy_media_url(image_url), "id": profile_id},
+        )
+
+
+def _clear_missing_image_urls(conn: Connection) -> None:
+    # Las bases de datos que ya aplicaron la migración 3 convirtieron las URLs sin imagen
+    # en '/media/None'; también se retira la clave 'None' que pudo encolarse para borrado
+    conn.execute(text("UPDATE profile SET image_url = NULL WHERE image_url = '/media/None'"))
+    if inspect(conn).has_table("mediacleanup"):
+        conn.execute(text("DELETE FROM mediacleanup WHERE key = 'None'"))
+
+
+def _add_profile_version(conn: Connection) -> None:
+    columns = {c["name"] for c in inspect(conn).get_columns("profile")}
+    if "version" not in columns:
+        conn.execute(text("ALTER TABLE profile ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _create_user_search(conn: Connection) -> None:
+    # Sin FTS5 no se crea; 'python -m app.cli rebuild-search' lo crea más adelante
+    rebuild_search_index(conn)
+
+
+def _create_media_sweep_lease(conn: Connection) -> None:
+    # create_all ya la crea; la versión nueva obliga a migrar antes de arrancar con FAST_STARTUP
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS mediasweeplease (id INTEGER NOT NULL PRIMARY KEY, expires_at TIMESTAMP NOT NULL)"
+    ))
+
+
+# (versión, descripción, función); añadir siempre al final con una versión nueva
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Columna user.version", _add_user_version),
+    (2, "Índices únicos en user.email, user.username y profile.user_id", _add_lookup_indexes),
+    (3, "URLs de imagen de perfil como '/media/<clave>'", _normalize_image_urls),
+    (4, "Columna profile.version", _add_profile_version),
+    (5, "Índice de búsqueda FTS5 de usuarios y perfiles", _create_user_search),
+    (6, "Perfiles sin imagen con image_url '/media/None' a NULL", _clear_missing_image_urls),
+    (7, "Tabla mediasweeplease (turno del barrido de media)", _create_media_sweep_lease),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def migrate(engine: Engine) -> int:
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema"""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        current = get_schema_version(conn)
+        for version, _description, apply in MIGRATIONS:
+            if version > current:
+                apply(conn)
+                conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+                current = version
+    return current
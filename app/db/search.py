@@ -0,0 +1,43 @@
+"""
+Índice de búsqueda de usuarios: tabla virtual FTS5 de SQLite con una fila por
+usuario (rowid = user.id) que reúne sus campos y los de su perfil.
+
+Las rutas de escritura lo mantienen al día fila a fila (app.services.search);
+rebuild_search_index lo regenera entero a partir de las tablas user y profile.
+En otros backends, o si SQLite no incluye FTS5, el índice no se crea y la
+búsqueda queda deshabilitada.
+"""
+from sqlalchemy import Connection, text
+
+SEARCH_TABLE = "user_search"
+
+# unicode61 sin diacríticos: 'jose' encuentra 'José'. Los índices de prefijo de 2 y 3
+# caracteres aceleran las búsquedas mientras se escribe ('al*', 'ali*')
+CREATE_SEARCH_TABLE = text(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "username, full_name, email, bio, location, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+# Filas del índice a partir de las tablas de origen; se completa con un WHERE
+SEARCH_SOURCE = (
+    f"INSERT INTO {SEARCH_TABLE} (rowid, username, full_name, email, bio, location) "
+    'SELECT u.id, u.username, u.full_name, u.email, p.bio, p.location '
+    'FROM "user" u LEFT JOIN profile p ON p.user_id = u.id'
+)
+
+
+def fts5_available(conn: Connection) -> bool:
+    if conn.dialect.name != "sqlite":
+        return False
+    options = {row[0] for row in conn.execute(text("PRAGMA compile_options"))}
+    return "ENABLE_FTS5" in options
+
+
+def rebuild_search_index(conn: Connection) -> int | None:
+    """Crea el índice si hace falta y lo rellena desde cero; None si no hay FTS5"""
+    if not fts5_available(conn):
+        return None
+    conn.execute(CREATE_SEARCH_TABLE)
+    conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    return conn.execute(text(SEARCH_SOURCE)).rowcount
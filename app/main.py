@@ -1,15 +1,43 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import time
+
+# Inicio de la importación de la aplicación, para el informe de arranque
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pathlib import Path
-from app.db.database import create_db_and_tables
-from app.api import users, auth, private, profiles     
+from app.db.database import async_engine, async_read_engine, check_schema_version, create_db_and_tables
+from app.core.security import password_pool
+from app.core.workers import WorkerPoolBusy
+from app.core.middleware import BodySizeLimitMiddleware, CompressionMiddleware, RateLimitMiddleware
+from app.core.rate_limit import RateLimitExceeded, ip_limiter, login_ip_limiter
+from app.core.config import (
+    UPLOAD_MAX_REQUEST_BYTES, RATE_LIMIT_ENABLED, RATE_LIMIT_TRUST_FORWARDED, METRICS_ENABLED,
+    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY, FAST_STARTUP,
+)
+from app.core.metrics import MetricsMiddleware, instrument_routes
+from app.core.responses import DefaultJSONResponse
+from app.core.startup import preload_heavy_modules, report_startup
+from app.utils.image_handler import image_pool, resume_pending_images, wait_for_background_images
+from app.utils.media_store import MEDIA_DIR
+from app.services.media_cleanup import media_cleanup
+from app.services.change_feed import change_feed
+from app.api import users, auth, private, profiles, media, metrics
 # Importamos el router de usuarios (lo crearemos en breve)
 
-import os
+import math
+
 
+app = FastAPI(default_response_class=DefaultJSONResponse)
 
-app = FastAPI()
+# Límites por IP. Se añade el primero para quedar dentro de CORS: los preflight
+# no consumen tokens y las respuestas 429 llevan las cabeceras CORS
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=(("/login", login_ip_limiter), ("/", ip_limiter)),
+        trust_forwarded=RATE_LIMIT_TRUST_FORWARDED,
+    )
 
 # Configurar CORS si es necesario
 app.add_middleware(
@@ -20,18 +48,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Cortar las subidas demasiado grandes antes de que se procese el formulario
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=UPLOAD_MAX_REQUEST_BYTES,
+    path_prefixes=("/profiles", "/media/uploads"),
+)
 
-# Obtener ruta absoluta a la carpeta 'media'
-ruta_media = os.path.join(os.path.dirname(os.path.dirname(__file__)), "media")
+# Compresión de las respuestas JSON grandes (las imágenes de /media ya van comprimidas)
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=GZIP_LEVEL,
+        brotli_quality=BROTLI_QUALITY,
+        exclude_prefixes=("/media", "/profiles/events"),
+    )
 
-# Montar la carpeta 'media' en la ruta '/media'
-app.mount("/media", StaticFiles(directory=ruta_media), name="media")
+# Métricas: el más externo, para medir también el tiempo de los demás middlewares
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Servir la carpeta 'media' en la ruta '/media' (con selección de variantes por tamaño)
+app.include_router(media.router, prefix="/media", tags=["media"])
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    started = time.perf_counter()
+    if FAST_STARTUP:
+        # Una consulta en lugar de create_all; PIL, passlib y jose se cargan en su primer uso
+        await check_schema_version()
+    else:
+        create_db_and_tables()
+        preload_heavy_modules()
     # Asegurarse de que existe el directorio media
-    Path("media").mkdir(exist_ok=True)
+    MEDIA_DIR.mkdir(exist_ok=True)
+    await resume_pending_images()
+    # Borrado de imágenes sin referencias y barrido periódico de 'media/'
+    media_cleanup.start()
+    # Reparto de los eventos de cambio entre las conexiones de /profiles/events
+    await change_feed.start()
+    report_startup(_import_finished - _import_started, time.perf_counter() - started)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await change_feed.stop()
+    await media_cleanup.stop()
+    await wait_for_background_images()
+    password_pool.shutdown()
+    image_pool.shutdown()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
+@app.exception_handler(WorkerPoolBusy)
+async def worker_pool_busy_handler(request: Request, exc: WorkerPoolBusy):
+    # Backpressure: el cliente debe reintentar pasados unos segundos
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, inténtalo de nuevo más tarde"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Demasiados intentos, inténtalo más tarde"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 
 # Incluir rutas de usuarios
@@ -44,5 +132,9 @@ app.include_router(private.router, tags=["private"])
 
 app.include_router(profiles.router, prefix="/profiles", tags=["profiles"])  # Nueva línea
 
+if METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["metrics"])
+    # Peticiones en curso por ruta (ya están todas las rutas)
+    instrument_routes(app.router.routes)
 
-
+_import_finished = time.perf_counter()
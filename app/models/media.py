@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+from sqlmodel import SQLModel, Field
+
+
+class MediaBlob(SQLModel, table=True):
+    """Imagen guardada por contenido y número de perfiles que la referencian"""
+    key: str = Field(primary_key=True)  # '<sha256>.<ext>'
+    refcount: int = 0
+
+
+def utcnow() -> datetime:
+    # SQLite guarda las fechas sin zona: todas las de la cola son UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class MediaCleanup(SQLModel, table=True):
+    """
+    Cola persistente de archivos a borrar. Se escribe en la misma transacción que
+    suelta la última referencia, así un fallo o un reinicio no deja archivos huérfanos.
+    """
+    key: str = Field(primary_key=True)
+    attempts: int = 0
+    # No se reintenta antes de este momento (espera creciente tras cada fallo)
+    not_before: datetime = Field(default_factory=utcnow, index=True)
+
+
+class MediaSweepLease(SQLModel, table=True):
+    """
+    Turno del barrido de media: el worker que lo toma barre y los demás no lo repiten
+    hasta que caduca. Una sola fila.
+    """
+    id: int = Field(default=1, primary_key=True)
+    expires_at: datetime
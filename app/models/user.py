@@ -1,12 +1,15 @@
 from sqlmodel import SQLModel, Field, Relationship # type: ignore
 from typing import Optional, List
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, computed_field
 from fastapi import UploadFile  # Agregamos esta importación
 
+from app.utils.image_variants import variant_urls
+
 
 class UserBase(SQLModel):
-    username: str
-    email: str
+    # Índices únicos: búsquedas por login y detección de duplicados en la base de datos
+    username: str = Field(index=True, unique=True)
+    email: str = Field(index=True, unique=True)
     full_name: str | None = None
     is_active: bool = True
 
@@ -14,9 +17,13 @@ class UserBase(SQLModel):
 class User(UserBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     hashed_password: str
+    # Se incrementa en cada modificación; permite detectar instantáneas y claims obsoletos
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     
-    # Activamos la relación con Profile
-    profile: Optional["Profile"] = Relationship(back_populates="user")
+    # Activamos la relación con Profile; el perfil se borra junto con el usuario
+    profile: Optional["Profile"] = Relationship(
+        back_populates="user", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
 
     # Relaciones futuras (opcional, por ahora dejamos la estructura)
     # posts: list["Post"] = Relationship(back_populates="user")
@@ -33,6 +40,30 @@ class UserRead(UserBase):
     id: int
 
 
+class UserSnapshot(UserBase):
+    """Instantánea del usuario autenticado (caché en memoria o claims del token)"""
+    id: int
+    version: int = 1
+
+
+class UserPage(SQLModel):
+    """Página del listado de usuarios con el cursor para pedir la siguiente"""
+    items: list[UserRead]
+    next_cursor: str | None = None
+
+
+class UserSearchResult(UserRead):
+    """Usuario encontrado por la búsqueda, con los campos de su perfil que se indexan"""
+    bio: str | None = None
+    location: str | None = None
+
+
+class UserSearchPage(SQLModel):
+    """Resultados por relevancia; 'next_offset' pide la página siguiente"""
+    items: list[UserSearchResult]
+    next_offset: int | None = None
+
+
 class UserUpdate(SQLModel):
     username: str | None = None
     email: str | None = None
@@ -57,7 +88,9 @@ class ProfileBase(SQLModel):
 
 class Profile(ProfileBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", index=True, unique=True)
+    # Se incrementa en cada modificación; junto a User.version forma el ETag del perfil
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     user: User = Relationship(back_populates="profile")
 
 
@@ -72,23 +105,31 @@ class ProfileRead(ProfileBase):
     id: int
     user_id: int
     user: UserInfo | None = None  # Agregamos la información del usuario
-    
-    def dict(self, *args, **kwargs):
-        profile_dict = super().dict(*args, **kwargs)
-        if profile_dict.get("image_url"):
-            profile_dict["image_url"] = f"/media/{profile_dict['image_url'].split('/')[-1]}"
-        return profile_dict
+
+    @computed_field
+    @property
+    def image_variants(self) -> dict[str, str] | None:
+        """URLs de la imagen por tamaño; /media sirve el mejor formato para el cliente"""
+        return variant_urls(self.image_url)
+
+
+class ProfileBatchRequest(SQLModel):
+    user_ids: list[int]
+
+
+class ProfileBatch(SQLModel):
+    """Perfiles por id de usuario; null si el usuario no tiene perfil o no existe"""
+    profiles: dict[int, ProfileRead | None]
 
 
 class ProfileFormData(ProfileBase):
     """Modelo para mostrar los datos actuales del formulario"""
     user_info: UserInfo
-    
-    def dict(self, *args, **kwargs):
-        form_dict = super().dict(*args, **kwargs)
-        if form_dict.get("image_url"):
-            form_dict["image_url"] = f"/media/{form_dict['image_url'].split('/')[-1]}"
-        return form_dict
+
+    @computed_field
+    @property
+    def image_variants(self) -> dict[str, str] | None:
+        return variant_urls(self.image_url)
 
 
 class ProfileUpdate(SQLModel):
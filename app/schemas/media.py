@@ -0,0 +1,20 @@
+from pydantic import Field
+from sqlmodel import SQLModel
+
+
+class ImageUploadRequest(SQLModel):
+    content_type: str  # image/jpeg, image/png o image/gif
+    size: int = Field(gt=0)  # Bytes que se van a subir
+
+
+class ImageUploadTicket(SQLModel):
+    upload_id: str  # Se envía a /profiles/me/image/complete al terminar la subida
+    method: str  # 'PUT' con el cuerpo en bruto o 'POST' con un formulario multipart
+    url: str
+    fields: dict[str, str] = {}  # Campos del formulario, antes del archivo (POST)
+    headers: dict[str, str] = {}  # Cabeceras que deben acompañar al cuerpo (PUT)
+    expires_in: int  # Segundos de validez de la URL
+
+
+class ImageUploadComplete(SQLModel):
+    upload_id: str = Field(pattern=r"^[0-9a-f]{32}$")
@@ -8,4 +8,15 @@ class Token(SQLModel):
 
 class LoginData(SQLModel):
     email: str
-    password: str
\ No newline at end of file
+    password: str
+
+
+class TokenPair(SQLModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int  # Segundos de validez del token de acceso
+
+
+class RefreshRequest(SQLModel):
+    refresh_token: str
@@ -0,0 +1,13 @@
+from sqlmodel import SQLModel
+
+
+class UserImportError(SQLModel):
+    line: int  # Línea del archivo (en CSV, la cabecera es la línea 1)
+    error: str
+
+
+class UserImportReport(SQLModel):
+    created: int = 0
+    failed: int = 0
+    errors: list[UserImportError] = []
+    errors_truncated: bool = False
@@ -0,0 +1,256 @@
+"""
+Feed de cambios de perfiles, para que los clientes dejen de sondear /profiles/{id}.
+
+Las rutas de escritura publican después del commit un evento compacto, p. ej.
+{"type": "profile.updated", "user_id": 7, "fields": ["bio", "image_url"]}, y cada
+worker lo reparte entre sus conexiones abiertas a GET /profiles/events (Server-Sent
+Events). Las conexiones se indexan por usuario seguido, así que publicar solo toca a
+quien sigue a ese usuario, y la trama se codifica una vez para todas. Una conexión en
+reposo cuesta su cola vacía y una entrada en el índice, sin consultas ni CPU.
+
+Cada conexión tiene una cola acotada: si un cliente lento la llena, se descartan sus
+eventos pendientes y se le envía 'resync' para que vuelva a pedir los perfiles que sigue.
+Lo mismo al reconectar (el navegador envía Last-Event-ID), porque los eventos publicados
+mientras estaba desconectado se han perdido.
+
+Los eventos llegan a los demás workers a través del backend. El de memoria solo entrega
+dentro del proceso: con varios workers hay que registrar con set_change_feed_backend
+una implementación compartida (p. ej. sobre Redis pub/sub).
+"""
+import asyncio
+import json
+import logging
+import random
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from typing import AsyncIterator, Callable, Iterable
+
+from app.core.config import (
+    CHANGE_FEED_KEEPALIVE, CHANGE_FEED_MAX_LIFETIME, CHANGE_FEED_MAX_SUBSCRIBERS, CHANGE_FEED_QUEUE_SIZE,
+    CHANGE_FEED_RETRY_MS,
+)
+from app.core.metrics import CHANGE_FEED_EVENTS, CHANGE_FEED_OVERFLOWS, CHANGE_FEED_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento
+PROFILE_CREATED = "profile.created"
+PROFILE_UPDATED = "profile.updated"
+USER_UPDATED = "user.updated"
+USER_DELETED = "user.deleted"
+
+
+class ChangeFeedBackend(ABC):
+    @abstractmethod
+    async def start(self, deliver: Callable[[dict], None]) -> None:
+        """
+        Empieza a entregar con deliver (en el event loop) los eventos que publique
+        cualquier worker, incluido este.
+        """
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, event: dict) -> None:
+        """Envía el evento (serializable a JSON) a todos los workers"""
+
+
+class MemoryChangeFeedBackend(ChangeFeedBackend):
+    """Entrega directa dentro del proceso (un solo worker)"""
+
+    def __init__(self):
+        self._deliver: Callable[[dict], None] | None = None
+
+    async def start(self, deliver: Callable[[dict], None]) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+    async def publish(self, event: dict) -> None:
+        if self._deliver is not None:
+            self._deliver(event)
+
+
+_backend: ChangeFeedBackend = MemoryChangeFeedBackend()
+
+
+def set_change_feed_backend(backend: ChangeFeedBackend) -> None:
+    """Sustituye el backend del feed de cambios (llamar antes de arrancar)"""
+    global _backend
+    _backend = backend
+
+
+def get_change_feed_backend() -> ChangeFeedBackend:
+    return _backend
+
+
+def encode_event(event: dict) -> bytes:
+    """Trama SSE de un evento"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode()
+
+
+RESYNC_FRAME = encode_event({"type": "resync"})
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+
+
+class Subscription:
+    """Una conexión abierta: los usuarios que sigue y sus tramas pendientes de enviar"""
+
+    def __init__(self, user_ids: frozenset[int], queue_size: int, deadline: float):
+        self.user_ids = user_ids
+        # Momento (loop.time()) a partir del cual se cierra la conexión
+        self.deadline = deadline
+        # None en la cola señala el cierre
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(queue_size)
+        self._overflowed = False
+        self._closed = False
+
+    def offer(self, frame: bytes) -> None:
+        if self._overflowed:
+            # Lo que llegue hasta enviar 'resync' ya lo cubre la resincronización
+            return
+        try:
+            self._queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._overflowed = True
+            CHANGE_FEED_OVERFLOWS.inc()
+
+    def ping(self) -> None:
+        # Solo hace falta si no hay nada pendiente de enviar
+        if self._queue.empty():
+            self._queue.put_nowait(KEEPALIVE_FRAME)
+
+    def close(self) -> None:
+        self._closed = True
+        with suppress(asyncio.QueueFull):
+            self._queue.put_nowait(None)
+
+    async def next_frame(self) -> bytes | None:
+        """Siguiente trama (un evento, 'resync' o keep-alive); None al cerrarse"""
+        if self._closed:
+            return None
+        if self._overflowed:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._overflowed = False
+            return RESYNC_FRAME
+        return await self._queue.get()
+
+
+class ChangeFeedBroker:
+    """Reparto en el proceso de los eventos entre las conexiones que siguen a cada usuario"""
+
+    def __init__(
+        self,
+        queue_size: int = CHANGE_FEED_QUEUE_SIZE,
+        max_subscribers: int = CHANGE_FEED_MAX_SUBSCRIBERS,
+        keepalive: float = CHANGE_FEED_KEEPALIVE,
+        retry_ms: int = CHANGE_FEED_RETRY_MS,
+        max_lifetime: float = CHANGE_FEED_MAX_LIFETIME,
+    ):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.retry_ms = retry_ms
+        self.max_lifetime = max_lifetime
+        self._by_user: dict[int, set[Subscription]] = {}
+        self._subscriptions: set[Subscription] = set()
+        self._ticker: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        await get_change_feed_backend().start(self._deliver)
+        self._ticker = asyncio.create_task(self._tick())
+
+    async def stop(self) -> None:
+        await get_change_feed_backend().stop()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+            self._ticker = None
+        # Cierra las suscripciones que sigan abiertas. No acorta el apagado con uvicorn,
+        # que espera a las respuestas en curso antes de llegar aquí: eso lo acotan
+        # CHANGE_FEED_MAX_LIFETIME y --timeout-graceful-shutdown
+        for subscription in list(self._subscriptions):
+            subscription.close()
+
+    async def _tick(self) -> None:
+        """
+        Un solo temporizador para todas las conexiones: envía los keep-alive y cierra
+        las que han cumplido su duración. Una conexión en reposo no tiene temporizador propio.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.keepalive)
+            now = loop.time()
+            for subscription in list(self._subscriptions):
+                if subscription.deadline <= now:
+                    subscription.close()
+                else:
+                    subscription.ping()
+
+    def is_full(self) -> bool:
+        """Se comprueba antes de abrir la respuesta; el límite es orientativo"""
+        return len(self._subscriptions) >= self.max_subscribers
+
+    def subscribe(self, user_ids: Iterable[int]) -> Subscription:
+        # Con algo de dispersión, para que las reconexiones no lleguen todas a la vez
+        deadline = asyncio.get_running_loop().time() + self.max_lifetime * random.uniform(0.8, 1.0)
+        subscription = Subscription(frozenset(user_ids), self.queue_size, deadline)
+        for user_id in subscription.user_ids:
+            self._by_user.setdefault(user_id, set()).add(subscription)
+        self._subscriptions.add(subscription)
+        CHANGE_FEED_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription not in self._subscriptions:
+            return
+        self._subscriptions.discard(subscription)
+        CHANGE_FEED_SUBSCRIBERS.dec()
+        for user_id in subscription.user_ids:
+            followers = self._by_user.get(user_id)
+            if followers is not None:
+                followers.discard(subscription)
+                if not followers:
+                    del self._by_user[user_id]
+
+    async def stream(self, user_ids: Iterable[int], reconnected: bool = False) -> AsyncIterator[bytes]:
+        """
+        Cuerpo de la respuesta SSE. La suscripción se crea al empezar a enviar y se
+        retira al terminar, también cuando el cliente se desconecta.
+        """
+        subscription = self.subscribe(user_ids)
+        try:
+            # Con un id, el navegador envía Last-Event-ID al reconectar
+            yield f"retry: {self.retry_ms}\nid: 0\n\n".encode()
+            if reconnected:
+                yield RESYNC_FRAME
+            while (frame := await subscription.next_frame()) is not None:
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+    def _deliver(self, event: dict) -> None:
+        CHANGE_FEED_EVENTS.inc()
+        followers = self._by_user.get(event["user_id"])
+        if not followers:
+            return
+        frame = encode_event(event)
+        for subscription in followers:
+            subscription.offer(frame)
+
+    async def publish(self, event_type: str, user_id: int, fields: Iterable[str] = ()) -> None:
+        """Publica un cambio ya confirmado; un fallo del backend no afecta a la escritura"""
+        event = {"type": event_type, "user_id": user_id}
+        if fields := sorted(fields):
+            event["fields"] = fields
+        try:
+            await get_change_feed_backend().publish(event)
+        except Exception:
+            logger.exception("No se pudo publicar el evento %s del usuario %d", event_type, user_id)
+
+
+change_feed = ChangeFeedBroker()
@@ -0,0 +1,281 @@
+"""
+Borrado de imágenes en segundo plano.
+
+release_media encola el archivo en la tabla mediacleanup dentro de la misma transacción
+que suelta su última referencia, y MediaCleanupWorker lo borra después en lotes, fuera
+de la petición. Los borrados que fallan se reintentan con una espera creciente; como la
+cola está en la base de datos, sobrevive a reinicios. Cada cierto tiempo, un barrido
+reconcilia el almacenamiento (app.storage) con MediaBlob y Profile.image_url y encola
+los archivos huérfanos (por ejemplo, los que dejó una versión anterior o un proceso que
+murió a medias); también borra las subidas directas que nunca se confirmaron. El
+barrido lo hace un solo worker por intervalo (turno en la tabla mediasweeplease) y
+avanza por lotes de batch_size imágenes, sin cargar el almacenamiento ni las tablas.
+"""
+import asyncio
+import logging
+import random
+import shutil
+import time
+from contextlib import suppress
+from datetime import timedelta
+from typing import Iterator
+
+from anyio import to_thread
+from sqlalchemy import and_, delete, or_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import (
+    MEDIA_CLEANUP_BATCH_SIZE, MEDIA_CLEANUP_INTERVAL, MEDIA_CLEANUP_MAX_BACKOFF,
+    MEDIA_SWEEP_INTERVAL, MEDIA_SWEEP_GRACE,
+)
+from app.db.database import async_engine, upsert_insert
+from app.models.media import MediaBlob, MediaCleanup, MediaSweepLease, utcnow
+from app.models.user import Profile
+from app.storage import StorageBackend, get_storage
+from app.utils.media_store import (
+    DIGEST_LEN, PENDING_DIR, STAGING_DIR, UPLOADS_PREFIX, image_group, is_content_key, media_key,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _clean_staging(cutoff: float) -> None:
+    """
+    Borra lo que dejaron en STAGING_DIR (siempre local) las subidas y los procesados
+    interrumpidos: archivos temporales y directorios de trabajo.
+    """
+    if not STAGING_DIR.is_dir():
+        return
+    for path in STAGING_DIR.iterdir():
+        with suppress(FileNotFoundError):
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink()
+
+
+def _scan_storage(
+    storage: StorageBackend, cutoff: float, batch_size: int
+) -> Iterator[tuple[dict[str, str], list[str]]]:
+    """
+    Recorre el almacenamiento y agrupa los archivos por imagen. Devuelve por lotes, para
+    cada imagen cuyos archivos son todos anteriores a 'cutoff', la clave con la que
+    encolarla, y las subidas directas que nadie confirmó a tiempo.
+
+    Los lotes se cortan al cambiar de directorio, donde las imágenes ya están completas
+    (sus variantes comparten directorio con el original), así la memoria depende del
+    tamaño del lote y no del almacenamiento. La copia pendiente de una imagen, en
+    'pending/', se juzga aparte.
+    """
+    groups: dict[str, tuple[str, float]] = {}
+    stale_uploads = []
+    current_directory = None
+
+    def add(group: str, key: str, mtime: float, is_original: bool) -> None:
+        previous_key, previous_mtime = groups.get(group, (key, 0.0))
+        groups[group] = (key if is_original else previous_key, max(mtime, previous_mtime))
+
+    def take_batch() -> tuple[dict[str, str], list[str]]:
+        candidates = {group: key for group, (key, mtime) in groups.items() if mtime < cutoff}
+        batch = candidates, stale_uploads[:]
+        groups.clear()
+        stale_uploads.clear()
+        return batch
+
+    for path, mtime in storage.list_files():
+        directory, _, name = path.rpartition("/")
+        if directory != current_directory:
+            if len(groups) + len(stale_uploads) >= batch_size:
+                yield take_batch()
+            current_directory = directory
+        if path.startswith(f"{UPLOADS_PREFIX}/"):
+            if mtime < cutoff:
+                stale_uploads.append(path)
+        elif directory == PENDING_DIR.name:
+            add(image_group(name), name, mtime, False)
+        elif is_content_key(name) or not directory:
+            add(image_group(name), name, mtime, "_" not in name)
+    if groups or stale_uploads:
+        yield take_batch()
+
+
+class MediaCleanupWorker:
+    """Tarea de fondo que vacía la cola de borrado y lanza el barrido periódico"""
+
+    def __init__(
+        self,
+        batch_size: int = MEDIA_CLEANUP_BATCH_SIZE,
+        interval: float = MEDIA_CLEANUP_INTERVAL,
+        max_backoff: float = MEDIA_CLEANUP_MAX_BACKOFF,
+        sweep_interval: float = MEDIA_SWEEP_INTERVAL,
+        sweep_grace: float = MEDIA_SWEEP_GRACE,
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.sweep_interval = sweep_interval
+        self.sweep_grace = sweep_grace
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._run()))
+        if self.sweep_interval > 0:
+            self._tasks.append(asyncio.create_task(self._sweep_periodically()))
+
+    async def stop(self) -> None:
+        # Lo que quede en la cola se procesa en el siguiente arranque
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def notify(self) -> None:
+        """Despierta al worker tras un commit que ha encolado archivos"""
+        self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.interval * 2 ** attempts, self.max_backoff)
+
+    async def process_due(self) -> int:
+        """Procesa un lote de la cola; devuelve cuántas entradas se han atendido"""
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            now = utcnow()
+            due = (await session.exec(
+                select(MediaCleanup.key)
+                .where(MediaCleanup.not_before <= now)
+                .order_by(MediaCleanup.not_before)
+                .limit(self.batch_size)
+            )).all()
+            if not due:
+                return 0
+
+            # Se reclaman las entradas borrándolas y no se confirma hasta borrar los archivos:
+            # acquire_media, que cancela la entrada de la imagen que vuelve a referenciar,
+            # espera a este commit o, si llegó antes, la entrada ya no se devuelve aquí
+            entries = dict((await session.exec(
+                delete(MediaCleanup)
+                .where(MediaCleanup.key.in_(due))
+                .returning(MediaCleanup.key, MediaCleanup.attempts)
+            )).all())
+            keys = list(entries)
+            live = await self._live_keys(session, keys)
+            failed = await get_storage().delete_images([k for k in keys if k not in live])
+
+            for key, error in failed.items():
+                attempts = entries[key] + 1
+                session.add(MediaCleanup(
+                    key=key, attempts=attempts, not_before=now + timedelta(seconds=self._backoff(attempts))
+                ))
+                logger.warning("No se pudo borrar %s (intento %d): %s", key, attempts, error)
+            await session.commit()
+            return len(due)
+
+    async def _live_keys(self, session: AsyncSession, keys: list[str]) -> set[str]:
+        """Claves que se han vuelto a referenciar mientras esperaban en la cola"""
+        referenced = await self._referenced_groups(session, {image_group(key) for key in keys})
+        return {key for key in keys if image_group(key) in referenced}
+
+    async def _referenced_groups(self, session: AsyncSession, groups: set[str]) -> set[str]:
+        """Imágenes (image_group) de 'groups' que referencia algún MediaBlob o perfil"""
+        referenced = set()
+        digests = [group for group in groups if is_content_key(group)]
+        if digests:
+            # Rango sobre la clave primaria: MediaBlob guarda el hash seguido de la extensión
+            blobs = (await session.exec(select(MediaBlob.key).where(or_(*(
+                and_(MediaBlob.key >= digest, MediaBlob.key < digest + "~") for digest in digests
+            ))))).all()
+            referenced.update(blob[:DIGEST_LEN] for blob in blobs)
+        legacy = groups.difference(digests)
+        if legacy:
+            # Las imágenes antiguas no tienen contador: se buscan en la URL del perfil, que
+            # puede ser relativa o absoluta (MEDIA_PUBLIC_BASE_URL)
+            urls = (await session.exec(
+                select(Profile.image_url).where(or_(*(Profile.image_url.contains(f"/{group}") for group in legacy)))
+            )).all()
+            referenced.update(legacy.intersection(image_group(key) for key in filter(None, map(media_key, urls))))
+        return referenced
+
+    async def _take_sweep_turn(self) -> bool:
+        """
+        Reserva el barrido para este worker durante un intervalo. Los demás workers lo
+        encuentran tomado y no repiten el recorrido del almacenamiento.
+        """
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            now = utcnow()
+            expires_at = now + timedelta(seconds=self.sweep_interval)
+            taken = (await session.exec(
+                (await upsert_insert(session))(MediaSweepLease)
+                .values(id=1, expires_at=expires_at)
+                .on_conflict_do_update(
+                    index_elements=[MediaSweepLease.id],
+                    set_={"expires_at": expires_at},
+                    where=MediaSweepLease.expires_at <= now,
+                )
+                .returning(MediaSweepLease.id)
+            )).first()
+            await session.commit()
+        return taken is not None
+
+    async def sweep(self) -> int:
+        """
+        Encola los archivos almacenados que no referencia nadie; devuelve cuántos. No hace
+        nada si otro worker ya tiene el turno del barrido.
+        """
+        if not await self._take_sweep_turn():
+            return 0
+        storage = get_storage()
+        cutoff = time.time() - self.sweep_grace
+        await to_thread.run_sync(_clean_staging, cutoff)
+        orphans = 0
+        # El recorrido avanza en un hilo, un lote cada vez
+        batches = _scan_storage(storage, cutoff, self.batch_size)
+        while (batch := await to_thread.run_sync(next, batches, None)) is not None:
+            candidates, stale_uploads = batch
+            if stale_uploads:
+                await storage.delete_files(stale_uploads)
+            if candidates:
+                orphans += await self._enqueue_orphans(candidates)
+        if orphans:
+            logger.info("Barrido de media: %d imágenes huérfanas encoladas", orphans)
+            self.notify()
+        return orphans
+
+    async def _enqueue_orphans(self, candidates: dict[str, str]) -> int:
+        """Encola las imágenes de un lote del barrido que nadie referencia; devuelve cuántas"""
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            referenced = await self._referenced_groups(session, set(candidates))
+            orphans = [key for group, key in candidates.items() if group not in referenced]
+            if not orphans:
+                return 0
+            queued = set((await session.exec(select(MediaCleanup.key).where(MediaCleanup.key.in_(orphans)))).all())
+            session.add_all(MediaCleanup(key=key) for key in orphans if key not in queued)
+            await session.commit()
+        return len(orphans)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                while await self.process_due() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Error procesando la cola de borrado de media")
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            # Se espera antes del primer barrido y con dispersión; el primer worker que
+            # despierta toma el turno y los demás se lo saltan (_take_sweep_turn)
+            await asyncio.sleep(self.sweep_interval * random.uniform(0.5, 1.5))
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Error en el barrido de media")
+
+
+media_cleanup = MediaCleanupWorker()
@@ -0,0 +1,121 @@
+"""
+Lectura de perfiles con los datos de su usuario en una sola consulta,
+con una caché de lectura por delante.
+"""
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from app.core.responses import weak_etag
+from app.models.user import Profile, ProfileRead, User, UserInfo
+
+# Perfiles ya proyectados a ProfileRead junto a su ETag, por id de usuario. Es local a cada proceso:
+# las escrituras invalidan la entrada en el worker que las atiende y el TTL acota
+# cuánto pueden tardar en verse en los demás.
+profile_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+# Solo las columnas que necesita ProfileRead, con el usuario unido en la misma consulta
+PROFILE_READ_QUERY = select(
+    Profile.id,
+    Profile.user_id,
+    Profile.bio,
+    Profile.image_url,
+    Profile.location,
+    Profile.website,
+    User.username,
+    User.email,
+    User.full_name,
+    Profile.version.label("profile_version"),
+    User.version.label("user_version"),
+).join(User, User.id == Profile.user_id)
+
+# Solo lo necesario para calcular el ETag y responder 304 sin cargar el perfil
+PROFILE_VERSION_QUERY = select(
+    Profile.id,
+    Profile.version.label("profile_version"),
+    User.version.label("user_version"),
+).join(User, User.id == Profile.user_id)
+
+
+def profile_etag(row) -> str:
+    """Cambia al modificar el perfil o su usuario (username, email y nombre van en la respuesta)"""
+    return weak_etag("p", row.id, row.profile_version, row.user_version)
+
+
+def _to_profile_read(row) -> ProfileRead:
+    return ProfileRead(
+        id=row.id,
+        user_id=row.user_id,
+        bio=row.bio,
+        image_url=row.image_url,
+        location=row.location,
+        website=row.website,
+        user=UserInfo(username=row.username, email=row.email, full_name=row.full_name),
+    )
+
+
+def build_profile_read(profile: Profile, user: UserInfo | User) -> ProfileRead:
+    """Proyecta un perfil ya cargado y los datos de su usuario a ProfileRead"""
+    return ProfileRead(
+        id=profile.id,
+        user_id=profile.user_id,
+        bio=profile.bio,
+        image_url=profile.image_url,
+        location=profile.location,
+        website=profile.website,
+        user=UserInfo(username=user.username, email=user.email, full_name=user.full_name),
+    )
+
+
+async def get_profile_read_with_etag(session: AsyncSession, user_id: int) -> tuple[ProfileRead, str] | None:
+    """Perfil de un usuario con sus datos y su ETag, desde la caché o con una única consulta"""
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    row = (await session.exec(PROFILE_READ_QUERY.where(Profile.user_id == user_id))).first()
+    if row is None:
+        return None
+    cached = (_to_profile_read(row), profile_etag(row))
+    profile_cache.set(user_id, cached)
+    return cached
+
+
+async def get_profile_read(session: AsyncSession, user_id: int) -> ProfileRead | None:
+    cached = await get_profile_read_with_etag(session, user_id)
+    return cached[0] if cached is not None else None
+
+
+async def get_profile_reads(session: AsyncSession, user_ids: list[int]) -> dict[int, ProfileRead | None]:
+    """Varios perfiles a la vez: los que no están en caché se leen con una sola consulta IN"""
+    profiles: dict[int, ProfileRead | None] = {}
+    missing = []
+    for user_id in user_ids:
+        cached = profile_cache.get(user_id)
+        if cached is not None:
+            profiles[user_id] = cached[0]
+        else:
+            profiles[user_id] = None
+            missing.append(user_id)
+
+    if missing:
+        for row in (await session.exec(PROFILE_READ_QUERY.where(Profile.user_id.in_(missing)))).all():
+            cached = (_to_profile_read(row), profile_etag(row))
+            profile_cache.set(row.user_id, cached)
+            profiles[row.user_id] = cached[0]
+    return profiles
+
+
+async def get_profile_etag(session: AsyncSession, user_id: int) -> str | None:
+    """ETag actual del perfil: de la caché si está, si no con la consulta de versiones"""
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return cached[1]
+    row = (await session.exec(PROFILE_VERSION_QUERY.where(Profile.user_id == user_id))).first()
+    return profile_etag(row) if row is not None else None
+
+
+def invalidate_profile(user_id: int) -> None:
+    """Descarta el perfil en caché tras crear, modificar o eliminar el perfil o su usuario"""
+    profile_cache.invalidate(user_id)
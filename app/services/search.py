@@ -0,0 +1,93 @@
+"""
+Búsqueda de usuarios por username, nombre, email, bio y ubicación sobre el índice
+FTS5 (app.db.search), y actualización incremental del índice desde las escrituras.
+
+Las funciones de actualización se llaman dentro de la transacción del llamador,
+así el índice nunca ve un cambio que luego se revierte.
+"""
+import re
+
+from sqlalchemy import bindparam, inspect, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.search import SEARCH_SOURCE, SEARCH_TABLE
+from app.models.user import UserSearchPage, UserSearchResult
+
+# Términos de la consulta que se tienen en cuenta (el resto se ignora)
+MAX_QUERY_TERMS = 8
+
+# Peso de cada columna en bm25: coincidir en el username pesa más que en la bio
+_RANK = f"bm25({SEARCH_TABLE}, 10.0, 5.0, 3.0, 1.0, 2.0)"
+
+_SEARCH_SQL = text(
+    "SELECT u.id, u.username, u.email, u.full_name, u.is_active, p.bio, p.location "
+    f"FROM {SEARCH_TABLE} s "
+    "JOIN \"user\" u ON u.id = s.rowid "
+    "LEFT JOIN profile p ON p.user_id = u.id "
+    f"WHERE {SEARCH_TABLE} MATCH :match "
+    f"ORDER BY {_RANK}, u.id "
+    "LIMIT :limit OFFSET :offset"
+)
+
+_INDEX_BY_EMAIL = text(f"{SEARCH_SOURCE} WHERE u.email IN :emails").bindparams(
+    bindparam("emails", expanding=True)
+)
+
+# Se decide una vez por proceso: la tabla se crea en las migraciones o con el CLI
+_search_enabled: bool | None = None
+
+
+async def search_enabled(session: AsyncSession) -> bool:
+    global _search_enabled
+    if _search_enabled is None:
+        _search_enabled = await session.run_sync(
+            lambda s: s.connection().dialect.name == "sqlite" and inspect(s.connection()).has_table(SEARCH_TABLE)
+        )
+    return _search_enabled
+
+
+def build_match_query(q: str) -> str | None:
+    """
+    Traduce el texto del usuario a una consulta FTS5 segura: cada palabra como
+    prefijo entre comillas ('ali gar' -> '"ali"* "gar"*', todas deben coincidir).
+    """
+    terms = re.findall(r"\w+", q.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+async def reindex_user(session: AsyncSession, user_id: int) -> None:
+    """Vuelve a indexar un usuario y su perfil con los datos pendientes de la sesión"""
+    if not await search_enabled(session):
+        return
+    await session.flush()
+    await session.exec(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), params={"id": user_id})
+    await session.exec(text(f"{SEARCH_SOURCE} WHERE u.id = :id"), params={"id": user_id})
+
+
+async def index_new_users(session: AsyncSession, emails: list[str]) -> None:
+    """Indexa usuarios recién insertados en bloque (aún sin perfil), por su email"""
+    if not emails or not await search_enabled(session):
+        return
+    await session.exec(_INDEX_BY_EMAIL, params={"emails": emails})
+
+
+async def unindex_user(session: AsyncSession, user_id: int) -> None:
+    if not await search_enabled(session):
+        return
+    await session.exec(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), params={"id": user_id})
+
+
+async def search_users(session: AsyncSession, q: str, limit: int, offset: int) -> UserSearchPage:
+    """Página de resultados ordenados por relevancia (bm25)"""
+    match = build_match_query(q)
+    if match is None:
+        return UserSearchPage(items=[])
+    # Una fila de más para saber si hay página siguiente
+    rows = (await session.exec(
+        _SEARCH_SQL, params={"match": match, "limit": limit + 1, "offset": offset}
+    )).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    items = [UserSearchResult.model_validate(row._mapping) for row in rows[:limit]]
+    return UserSearchPage(items=items, next_offset=next_offset)
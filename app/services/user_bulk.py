@@ -0,0 +1,247 @@
+"""
+Importación y exportación masiva de usuarios (NDJSON o CSV), compartida por
+los endpoints de administración y por la línea de comandos.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import (
+    USERS_IMPORT_BATCH_SIZE, USERS_IMPORT_HASH_CHUNK, USERS_IMPORT_MAX_ERRORS, USERS_STREAM_BATCH_SIZE,
+)
+from app.core.security import hash_passwords_async
+from app.models.user import User, UserCreate, UserRead
+from app.services.search import index_new_users
+from app.schemas.user_import import UserImportError, UserImportReport
+
+FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ["id", "username", "email", "full_name", "is_active"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _decode_line(line: bytes) -> str | None:
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError:
+        return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str | None]:
+    """
+    Parte un flujo de bytes en líneas de texto sin cargarlo entero en memoria.
+    Las líneas que no son UTF-8 válido se entregan como None, para informarlas como error.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode_line(line)
+    if buffer:
+        yield _decode_line(buffer)
+
+
+_INVALID_UTF8 = "La línea no es UTF-8 válido"
+
+
+async def _parse_ndjson(lines: AsyncIterator[str | None]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line is None:
+            yield line_number, None, _INVALID_UTF8
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, "JSON inválido"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Se esperaba un objeto JSON"
+            continue
+        yield line_number, row, None
+
+
+async def _parse_csv(lines: AsyncIterator[str | None]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    # Una fila por línea: los campos no pueden contener saltos de línea
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line is None:
+            yield line_number, None, _INVALID_UTF8
+            continue
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_number, None, f"Se esperaban {len(header)} columnas"
+            continue
+        # Las celdas vacías se tratan como campos ausentes
+        yield line_number, {k: v for k, v in zip(header, values) if v != ""}, None
+
+
+def parse_rows(fmt: str, lines: AsyncIterator[str | None]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """Genera (línea, fila, error) para cada registro del archivo"""
+    if fmt == "csv":
+        return _parse_csv(lines)
+    return _parse_ndjson(lines)
+
+
+def _first_error(e: ValidationError) -> str:
+    error = e.errors()[0]
+    field = ".".join(str(part) for part in error["loc"])
+    return f"{field}: {error['msg']}" if field else error["msg"]
+
+
+class _Importer:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.report = UserImportReport()
+
+    def fail(self, line: int, error: str) -> None:
+        self.report.failed += 1
+        if len(self.report.errors) < USERS_IMPORT_MAX_ERRORS:
+            self.report.errors.append(UserImportError(line=line, error=error))
+        else:
+            self.report.errors_truncated = True
+
+    async def _existing(self, users: list[tuple[int, UserCreate]]) -> tuple[set[str], set[str]]:
+        """Emails y usernames del lote que ya existen, en una sola consulta"""
+        emails = [user.email for _, user in users]
+        usernames = [user.username for _, user in users]
+        rows = (await self.session.exec(
+            select(User.email, User.username).where(
+                or_(User.email.in_(emails), User.username.in_(usernames))
+            )
+        )).all()
+        return {row.email for row in rows}, {row.username for row in rows}
+
+    async def import_batch(self, batch: list[tuple[int, dict]]) -> None:
+        # Validar y descartar duplicados dentro del propio lote
+        users: list[tuple[int, UserCreate]] = []
+        seen_emails: set[str] = set()
+        seen_usernames: set[str] = set()
+        for line, row in batch:
+            try:
+                user = UserCreate.model_validate(row)
+            except ValidationError as e:
+                self.fail(line, _first_error(e))
+                continue
+            if user.email in seen_emails or user.username in seen_usernames:
+                self.fail(line, "Usuario duplicado en el archivo")
+                continue
+            seen_emails.add(user.email)
+            seen_usernames.add(user.username)
+            users.append((line, user))
+        if not users:
+            return
+
+        # Duplicados contra la base de datos, antes de gastar tiempo en bcrypt
+        existing_emails, existing_usernames = await self._existing(users)
+        pending = []
+        for line, user in users:
+            if user.email in existing_emails or user.username in existing_usernames:
+                self.fail(line, "El usuario ya existe")
+            else:
+                pending.append((line, user))
+        if not pending:
+            return
+
+        hashes = await hash_passwords_async([user.password for _, user in pending], USERS_IMPORT_HASH_CHUNK)
+        values = [
+            {
+                "username": user.username,
+                "email": user.email,
+                "full_name": user.full_name,
+                "is_active": user.is_active,
+                "hashed_password": hashed,
+            }
+            for (_, user), hashed in zip(pending, hashes)
+        ]
+        try:
+            # Un único INSERT con todas las filas y un commit por lote
+            await self.session.exec(insert(User), params=values)
+            await index_new_users(self.session, [row["email"] for row in values])
+            await self.session.commit()
+            self.report.created += len(values)
+        except IntegrityError:
+            # Alguien creó uno de estos usuarios mientras tanto: insertar de uno en uno
+            await self.session.rollback()
+            await self._insert_one_by_one(pending, values)
+
+    async def _insert_one_by_one(self, pending: list[tuple[int, UserCreate]], values: list[dict]) -> None:
+        for (line, _), row in zip(pending, values):
+            try:
+                await self.session.exec(insert(User), params=[row])
+                await index_new_users(self.session, [row["email"]])
+                await self.session.commit()
+                self.report.created += 1
+            except IntegrityError:
+                await self.session.rollback()
+                self.fail(line, "El usuario ya existe")
+
+
+async def import_users(
+    session: AsyncSession, rows: AsyncIterator[tuple[int, dict | None, str | None]]
+) -> UserImportReport:
+    """
+    Importa los usuarios por lotes de USERS_IMPORT_BATCH_SIZE: cada lote se valida,
+    se comprueba contra la base de datos con una consulta, se hashea en paralelo
+    y se inserta en una transacción. Las filas inválidas se anotan en el informe.
+    """
+    importer = _Importer(session)
+    batch: list[tuple[int, dict]] = []
+    async for line, row, error in rows:
+        if error is not None:
+            importer.fail(line, error)
+            continue
+        batch.append((line, row))
+        if len(batch) >= USERS_IMPORT_BATCH_SIZE:
+            await importer.import_batch(batch)
+            batch = []
+    if batch:
+        await importer.import_batch(batch)
+    importer.report.errors.sort(key=lambda error: error.line)
+    return importer.report
+
+
+async def iter_user_batches(session: AsyncSession, after_id: int = 0) -> AsyncIterator[list[User]]:
+    """Lee los usuarios por id con el cursor del servidor, por lotes"""
+    statement = select(User).where(User.id > after_id).order_by(User.id)
+    result = await session.stream_scalars(
+        statement, execution_options={"yield_per": USERS_STREAM_BATCH_SIZE}
+    )
+    async for batch in result.partitions():
+        yield batch
+
+
+async def export_users(session: AsyncSession, fmt: str) -> AsyncIterator[str]:
+    """Genera todos los usuarios (sin contraseñas) en NDJSON o CSV, un bloque por lote"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        async for batch in iter_user_batches(session):
+            writer.writerows(UserRead.model_validate(user).model_dump(include=set(EXPORT_FIELDS)) for user in batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+
+    async for batch in iter_user_batches(session):
+        yield "".join(UserRead.model_validate(user).model_dump_json() + "\n" for user in batch)
@@ -0,0 +1,40 @@
+"""
+Almacenamiento de media intercambiable: disco local (por defecto) o S3 y compatibles.
+
+El backend se elige con MEDIA_STORAGE y se crea en el primer uso; set_storage permite
+registrar otra implementación de StorageBackend antes de arrancar.
+"""
+from app.core.config import MEDIA_STORAGE, S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, S3_REGION
+from app.storage.base import PresignedUpload, StorageBackend, UploadNotFound, UploadTooLarge
+
+_storage: StorageBackend | None = None
+
+
+def _create_storage() -> StorageBackend:
+    if MEDIA_STORAGE == "local":
+        from app.storage.local import LocalStorageBackend
+
+        return LocalStorageBackend()
+    if MEDIA_STORAGE == "s3":
+        from app.storage.s3 import S3StorageBackend
+
+        return S3StorageBackend(S3_BUCKET, prefix=S3_PREFIX, region=S3_REGION, endpoint_url=S3_ENDPOINT_URL)
+    raise RuntimeError(f"MEDIA_STORAGE desconocido: '{MEDIA_STORAGE}' (usa 'local' o 's3')")
+
+
+def set_storage(storage: StorageBackend) -> None:
+    """Sustituye el backend de almacenamiento (llamar antes de arrancar)"""
+    global _storage
+    _storage = storage
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = _create_storage()
+    return _storage
+
+
+__all__ = [
+    "PresignedUpload", "StorageBackend", "UploadNotFound", "UploadTooLarge", "get_storage", "set_storage",
+]
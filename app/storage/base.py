@@ -0,0 +1,74 @@
+"""
+Interfaz de los backends de almacenamiento de media.
+
+Las imágenes se validan y procesan en disco local (MEDIA_DIR/tmp) y el resultado se
+publica con save(), usando los nombres de media_store (clave por contenido y variantes)
+que cada backend ubica con storage_path(). Las subidas directas de los clientes llegan
+a 'uploads/<user_id>/<id>' con una URL firmada, sin pasar por la API, y se recogen
+con fetch_upload() cuando el cliente confirma la subida.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+
+class UploadNotFound(Exception):
+    """La subida directa no existe: no se llegó a enviar, caducó o ya se recogió"""
+
+
+class UploadTooLarge(ValueError):
+    """La subida directa supera el tamaño firmado"""
+
+
+@dataclass
+class PresignedUpload:
+    """Cómo debe enviar el cliente los bytes de la imagen al almacenamiento"""
+    method: str  # 'PUT' con el cuerpo en bruto, o 'POST' con un formulario multipart
+    url: str
+    # Campos que deben ir antes del archivo en el formulario (POST)
+    fields: dict[str, str] = field(default_factory=dict)
+    # Cabeceras que deben acompañar al cuerpo (PUT)
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class StorageBackend(ABC):
+    # El disco local sirve los archivos por /media, incluidos los originales pendientes
+    # de optimizar; los backends remotos redirigen a su propia URL
+    is_local = False
+
+    @abstractmethod
+    async def save(self, filename: str, src_path: Path) -> None:
+        """Publica un archivo ya procesado (original o variante); src_path se consume"""
+
+    @abstractmethod
+    async def exists(self, filename: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete_images(self, keys: list[str]) -> dict[str, str]:
+        """Borra cada imagen con sus variantes; devuelve las claves que fallaron y el motivo"""
+
+    @abstractmethod
+    def list_files(self) -> Iterator[tuple[str, float]]:
+        """Rutas relativas y fecha de modificación de todo lo almacenado (bloqueante)"""
+
+    @abstractmethod
+    async def delete_files(self, paths: list[str]) -> None:
+        """Borra archivos sueltos por su ruta relativa (subidas abandonadas)"""
+
+    @abstractmethod
+    async def presign_upload(self, path: str, content_type: str, max_bytes: int, expires: int) -> PresignedUpload:
+        ...
+
+    @abstractmethod
+    async def fetch_upload(self, path: str, dst_path: Path, max_bytes: int) -> int:
+        """Mueve una subida directa a disco local para validarla y devuelve su tamaño"""
+
+    @abstractmethod
+    async def restore_upload(self, path: str, src_path: Path) -> None:
+        """Devuelve a su sitio una subida recogida con fetch_upload; src_path se consume"""
+
+    @abstractmethod
+    async def download_url(self, filename: str) -> str:
+        """URL pública o firmada desde la que el cliente descarga el archivo"""
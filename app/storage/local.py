@@ -0,0 +1,163 @@
+"""
+Almacenamiento en el directorio media/ del propio nodo.
+
+Las subidas directas se envían con PUT a /media/uploads/<token>: el token firma la ruta
+de destino, el tipo de contenido, el tamaño máximo y la caducidad, así que la API no
+necesita guardar nada al emitir la URL.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from contextlib import suppress
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+import anyio
+from anyio import to_thread
+
+from app.core.config import JWT_SECRET_KEY
+from app.storage.base import PresignedUpload, StorageBackend, UploadNotFound, UploadTooLarge
+from app.utils.media_store import (
+    MEDIA_DIR, STAGING_DIR, image_group, media_index, media_path, media_url, pending_path,
+)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class LocalStorageBackend(StorageBackend):
+    is_local = True
+
+    def __init__(self, root: Path = MEDIA_DIR, secret: str = JWT_SECRET_KEY):
+        self.root = root
+        self._secret = secret.encode()
+
+    async def save(self, filename: str, src_path: Path) -> None:
+        # src_path está en MEDIA_DIR/tmp, en el mismo sistema de archivos: basta un rename
+        dst_path = media_path(filename)
+        await anyio.Path(dst_path.parent).mkdir(parents=True, exist_ok=True)
+        await anyio.Path(src_path).replace(dst_path)
+        media_index.invalidate(dst_path)
+
+    async def exists(self, filename: str) -> bool:
+        return await anyio.Path(media_path(filename)).is_file()
+
+    def _delete_image(self, key: str) -> None:
+        group = image_group(key)
+        # Se buscan los archivos en disco en lugar de derivar sus nombres de la configuración
+        # actual, así también se borran variantes de tamaños o formatos ya retirados
+        directory = media_path(key).parent
+        paths = [pending_path(key)]
+        if directory.is_dir():
+            paths += [p for p in directory.iterdir() if image_group(p.name) == group and p.is_file()]
+        # El original se borra el último: si algo falla a medias, el barrido lo vuelve a encontrar
+        paths.sort(key=lambda p: p.name == key and p.parent == directory)
+        for path in paths:
+            media_index.invalidate(path)
+            with suppress(FileNotFoundError):
+                path.unlink()
+
+    def _delete_batch(self, keys: list[str]) -> dict[str, str]:
+        failed = {}
+        for key in keys:
+            try:
+                self._delete_image(key)
+            except OSError as e:
+                failed[key] = str(e)
+        return failed
+
+    async def delete_images(self, keys: list[str]) -> dict[str, str]:
+        # Un solo salto al threadpool por lote
+        return await to_thread.run_sync(self._delete_batch, keys)
+
+    def list_files(self) -> Iterator[tuple[str, float]]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            directory = Path(dirpath)
+            if directory == self.root:
+                # Subidas en curso del propio servidor: las limpia el barrido aparte
+                dirnames[:] = [d for d in dirnames if self.root / d != STAGING_DIR]
+            for name in filenames:
+                path = directory / name
+                with suppress(FileNotFoundError):
+                    yield path.relative_to(self.root).as_posix(), path.stat().st_mtime
+
+    async def delete_files(self, paths: list[str]) -> None:
+        for path in paths:
+            await anyio.Path(self.root / path).unlink(missing_ok=True)
+
+    # Subidas directas
+
+    def _sign(self, payload: bytes) -> str:
+        return _b64encode(hmac.new(self._secret, payload, hashlib.sha256).digest())
+
+    async def presign_upload(self, path: str, content_type: str, max_bytes: int, expires: int) -> PresignedUpload:
+        payload = json.dumps(
+            {"p": path, "t": content_type, "m": max_bytes, "e": int(time.time()) + expires},
+            separators=(",", ":"),
+        ).encode()
+        token = f"{_b64encode(payload)}.{self._sign(payload)}"
+        return PresignedUpload(method="PUT", url=f"/media/uploads/{token}", headers={"Content-Type": content_type})
+
+    def verify_upload_token(self, token: str) -> tuple[str, str, int]:
+        """Ruta, tipo de contenido y tamaño máximo firmados; ValueError si no es válido o caducó"""
+        encoded, _, signature = token.partition(".")
+        try:
+            payload = _b64decode(encoded)
+        except ValueError:
+            raise ValueError("URL de subida inválida")
+        if not hmac.compare_digest(self._sign(payload), signature):
+            raise ValueError("URL de subida inválida")
+        data = json.loads(payload)
+        if data["e"] < time.time():
+            raise ValueError("La URL de subida ha caducado")
+        return data["p"], data["t"], data["m"]
+
+    async def receive_upload(self, path: str, chunks: AsyncIterator[bytes], max_bytes: int) -> int:
+        """Escribe el cuerpo de un PUT firmado; el archivo solo aparece completo"""
+        dst_path = self.root / path
+        tmp_path = dst_path.with_name(dst_path.name + ".part")
+        await anyio.Path(dst_path.parent).mkdir(parents=True, exist_ok=True)
+        written = 0
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise UploadTooLarge(f"La imagen supera el máximo de {max_bytes} bytes")
+                    await f.write(chunk)
+            await anyio.Path(tmp_path).replace(dst_path)
+        finally:
+            await anyio.Path(tmp_path).unlink(missing_ok=True)
+        return written
+
+    async def fetch_upload(self, path: str, dst_path: Path, max_bytes: int) -> int:
+        src_path = anyio.Path(self.root / path)
+        try:
+            size = (await src_path.stat()).st_size
+        except FileNotFoundError:
+            raise UploadNotFound(path)
+        if size > max_bytes:
+            await src_path.unlink(missing_ok=True)
+            raise UploadTooLarge(f"La imagen supera el máximo de {max_bytes} bytes")
+        try:
+            await src_path.replace(dst_path)
+        except FileNotFoundError:
+            # Otra confirmación de la misma subida se la llevó primero
+            raise UploadNotFound(path)
+        return size
+
+    async def restore_upload(self, path: str, src_path: Path) -> None:
+        dst_path = self.root / path
+        await anyio.Path(dst_path.parent).mkdir(parents=True, exist_ok=True)
+        await anyio.Path(src_path).replace(dst_path)
+
+    async def download_url(self, filename: str) -> str:
+        return media_url(filename)
@@ -0,0 +1,182 @@
+"""
+Almacenamiento en S3 o en un servicio compatible (MinIO, Ceph, un servidor local de
+pruebas...) indicado con S3_ENDPOINT_URL.
+
+Los clientes suben con un formulario POST firmado directamente al bucket, que limita
+el tamaño y el tipo de contenido, y descargan de MEDIA_PUBLIC_BASE_URL (CDN o bucket
+público) o, si no se configura, de URLs GET firmadas. boto3 es síncrono: cada llamada
+de red se ejecuta en el threadpool.
+"""
+import mimetypes
+from pathlib import Path
+from typing import Iterator
+
+import anyio
+from anyio import to_thread
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # dependencia opcional, solo necesaria con MEDIA_STORAGE=s3
+    boto3 = None
+
+from app.core.cache import TTLCache
+from app.core.config import (
+    MEDIA_CACHE_MAX_AGE, MEDIA_DOWNLOAD_URL_EXPIRES, MEDIA_INDEX_SIZE, MEDIA_INDEX_TTL, MEDIA_PUBLIC_BASE_URL,
+)
+from app.storage.base import PresignedUpload, StorageBackend, UploadNotFound, UploadTooLarge
+from app.utils.image_variants import VARIANT_FORMATS
+from app.utils.media_store import image_group, storage_path
+
+# Límite de claves por llamada a DeleteObjects
+_DELETE_BATCH = 1000
+
+
+def _content_type(filename: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return VARIANT_FORMATS.get(ext) or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _is_not_found(e: "ClientError") -> bool:
+    return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+class S3StorageBackend(StorageBackend):
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        region: str | None = None,
+        endpoint_url: str | None = None,
+        public_base_url: str = MEDIA_PUBLIC_BASE_URL,
+        download_expires: int = MEDIA_DOWNLOAD_URL_EXPIRES,
+    ):
+        if boto3 is None:
+            raise RuntimeError("MEDIA_STORAGE=s3 requiere el paquete boto3")
+        if not bucket:
+            raise RuntimeError("MEDIA_STORAGE=s3 requiere S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_base_url = public_base_url
+        self.download_expires = download_expires
+        # Los clientes de boto3 se pueden compartir entre hilos
+        self._client = boto3.client("s3", region_name=region, endpoint_url=endpoint_url)
+        # Solo se recuerdan los archivos que existen: uno ausente puede aparecer en cualquier momento
+        self._existing = TTLCache(maxsize=MEDIA_INDEX_SIZE, ttl=MEDIA_INDEX_TTL)
+
+    def _key(self, path: str) -> str:
+        return self.prefix + path
+
+    async def save(self, filename: str, src_path: Path) -> None:
+        await to_thread.run_sync(lambda: self._client.upload_file(
+            str(src_path),
+            self.bucket,
+            self._key(storage_path(filename)),
+            ExtraArgs={
+                "ContentType": _content_type(filename),
+                # Los nombres son únicos por contenido y nunca se reescriben
+                "CacheControl": f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable",
+            },
+        ))
+        await anyio.Path(src_path).unlink(missing_ok=True)
+        self._existing.set(filename, True)
+
+    async def exists(self, filename: str) -> bool:
+        if self._existing.get(filename):
+            return True
+        try:
+            await to_thread.run_sync(lambda: self._client.head_object(
+                Bucket=self.bucket, Key=self._key(storage_path(filename))
+            ))
+        except ClientError as e:
+            if _is_not_found(e):
+                return False
+            raise
+        self._existing.set(filename, True)
+        return True
+
+    def _delete_objects(self, keys: list[str]) -> dict[str, str]:
+        """Borra por lotes de hasta 1000 claves; devuelve las que fallaron"""
+        failed = {}
+        for start in range(0, len(keys), _DELETE_BATCH):
+            chunk = keys[start:start + _DELETE_BATCH]
+            response = self._client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True}
+            )
+            for error in response.get("Errors", []):
+                failed[error["Key"]] = error.get("Message", error.get("Code", ""))
+        return failed
+
+    def _delete_batch(self, keys: list[str]) -> dict[str, str]:
+        # Original y variantes comparten directorio y grupo: se listan por prefijo
+        objects: dict[str, str] = {}
+        for key in keys:
+            directory, _, _ = storage_path(key).rpartition("/")
+            prefix = self._key(f"{directory}/" if directory else "") + image_group(key)
+            for page in self._client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+                for item in page.get("Contents", []):
+                    name = item["Key"].rsplit("/", 1)[-1]
+                    if image_group(name) == image_group(key):
+                        objects[item["Key"]] = key
+                        self._existing.invalidate(name)
+        failed = {}
+        for object_key, error in self._delete_objects(list(objects)).items():
+            failed[objects[object_key]] = error
+        return failed
+
+    async def delete_images(self, keys: list[str]) -> dict[str, str]:
+        try:
+            return await to_thread.run_sync(self._delete_batch, keys)
+        except ClientError as e:
+            return {key: str(e) for key in keys}
+
+    def list_files(self) -> Iterator[tuple[str, float]]:
+        for page in self._client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):], item["LastModified"].timestamp()
+
+    async def delete_files(self, paths: list[str]) -> None:
+        await to_thread.run_sync(self._delete_objects, [self._key(path) for path in paths])
+
+    async def presign_upload(self, path: str, content_type: str, max_bytes: int, expires: int) -> PresignedUpload:
+        # El propio bucket rechaza tipos distintos y cuerpos mayores que max_bytes
+        post = await to_thread.run_sync(lambda: self._client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=self._key(path),
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+            ExpiresIn=expires,
+        ))
+        return PresignedUpload(method="POST", url=post["url"], fields=post["fields"])
+
+    def _fetch(self, key: str, dst_path: Path, max_bytes: int) -> int:
+        try:
+            size = self._client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if _is_not_found(e):
+                raise UploadNotFound(key)
+            raise
+        if size > max_bytes:
+            self._client.delete_object(Bucket=self.bucket, Key=key)
+            raise UploadTooLarge(f"La imagen supera el máximo de {max_bytes} bytes")
+        self._client.download_file(self.bucket, key, str(dst_path))
+        # La subida se recoge una sola vez
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+        return size
+
+    async def fetch_upload(self, path: str, dst_path: Path, max_bytes: int) -> int:
+        return await to_thread.run_sync(self._fetch, self._key(path), dst_path, max_bytes)
+
+    async def restore_upload(self, path: str, src_path: Path) -> None:
+        await to_thread.run_sync(lambda: self._client.upload_file(str(src_path), self.bucket, self._key(path)))
+        await anyio.Path(src_path).unlink(missing_ok=True)
+
+    async def download_url(self, filename: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{storage_path(filename)}"
+        # generate_presigned_url firma en local, sin llamadas de red
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(storage_path(filename))},
+            ExpiresIn=self.download_expires,
+        )
@@ -1,46 +1,270 @@
-import os
+import asyncio
+import hashlib
+import logging
+import shutil
 from fastapi import UploadFile # type: ignore
-from PIL import Image
 from pathlib import Path
-import shutil
 import uuid
 
-# Crear directorio media si no existe
-MEDIA_DIR = Path("media")
-MEDIA_DIR.mkdir(exist_ok=True)
+import anyio
+from anyio import to_thread
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import (
+    IMAGE_WORKERS, IMAGE_MAX_PENDING, IMAGE_RETRY_AFTER,
+    IMAGE_OPTIMIZE_IN_BACKGROUND, IMAGE_UPLOAD_CHUNK_SIZE,
+    IMAGE_MAX_BYTES, IMAGE_MAX_PIXELS, IMAGE_PROBE_MAX_BYTES, IMAGE_VARIANT_SIZES,
+)
+from app.core.metrics import IMAGE_BYTES_PROCESSED
+from app.core.workers import WorkerPool, WorkerPoolBusy
+from app.storage import get_storage
+from app.utils.image_variants import enabled_variant_formats
+from app.utils.image_probe import sniff_format, probe_dimensions
+from app.utils.media_store import STAGING_DIR, PENDING_DIR, acquire_media, pending_path
+
+logger = logging.getLogger(__name__)
+
+# Formatos aceptados (detectados por sus bytes mágicos) y la extensión con la que se guardan
+ALLOWED_FORMATS = {"jpeg": ".jpg", "png": ".png", "gif": ".gif"}
+# Tipos de contenido que se pueden declarar al pedir una URL de subida directa
+ALLOWED_CONTENT_TYPES = {"image/jpeg": "jpeg", "image/png": "png", "image/gif": "gif"}
+
+
+class ImageTooLargeError(ValueError):
+    """La imagen supera el tamaño en bytes o en píxeles permitido"""
 
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif"}
+# Pool de procesos para decodificar y recodificar imágenes fuera del event loop
+image_pool = WorkerPool(
+    "image",
+    max_workers=IMAGE_WORKERS,
+    max_pending=IMAGE_MAX_PENDING,
+    retry_after=IMAGE_RETRY_AFTER,
+)
 
-async def save_image(file: UploadFile) -> str:
+# Optimizaciones pendientes en segundo plano (se guarda la referencia para que no se recolecten)
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _check_header(head: bytes, at_eof: bool) -> str | None:
     """
-    Guarda una imagen subida y retorna la ruta relativa donde se guardó
+    Valida el formato y las dimensiones con los primeros bytes de la imagen. Devuelve
+    el formato detectado, o None si aún hacen falta más bytes para leer las dimensiones.
     """
-    # Verificar la extensión del archivo
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in ALLOWED_EXTENSIONS:
+    image_format = sniff_format(head)
+    if image_format not in ALLOWED_FORMATS:
         raise ValueError("Tipo de archivo no permitido")
+
+    dimensions = probe_dimensions(image_format, head)
+    if dimensions is None:
+        if len(head) >= IMAGE_PROBE_MAX_BYTES:
+            raise ValueError("No se encontraron las dimensiones de la imagen")
+        if at_eof:
+            raise ValueError("Imagen incompleta")
+        return None
+
+    width, height = dimensions
+    if width == 0 or height == 0:
+        raise ValueError("Dimensiones de imagen inválidas")
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLargeError(f"La imagen supera el máximo de {IMAGE_MAX_PIXELS} píxeles")
+    if len(head) > IMAGE_MAX_BYTES:
+        raise ImageTooLargeError(f"La imagen supera el máximo de {IMAGE_MAX_BYTES} bytes")
+    return image_format
+
+
+async def _read_header(file: UploadFile) -> tuple[str, bytes]:
+    """
+    Lee solo el principio de la subida para validar el formato y las dimensiones.
+    Devuelve el formato detectado y los bytes leídos, que aún hay que escribir.
+    """
+    head = await file.read(IMAGE_UPLOAD_CHUNK_SIZE)
+    at_eof = False
+    while (image_format := _check_header(head, at_eof)) is None:
+        chunk = await file.read(IMAGE_UPLOAD_CHUNK_SIZE)
+        at_eof = not chunk
+        head += chunk
+    return image_format, head
+
+
+def _inspect_file(file_path: Path) -> tuple[str, str]:
+    """Valida una imagen ya en disco y calcula su sha256 (bloqueante, se ejecuta en un hilo)"""
+    with open(file_path, "rb") as f:
+        head = f.read(IMAGE_PROBE_MAX_BYTES)
+        image_format = _check_header(head, at_eof=True)
+        digest = hashlib.sha256(head)
+        while chunk := f.read(IMAGE_UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return image_format, digest.hexdigest()
+
+
+async def _write_upload(file: UploadFile, head: bytes, file_path: Path) -> tuple[str, int]:
+    """
+    Copia la subida a disco por bloques con E/S asíncrona, cortando al superar el límite.
+    Devuelve el sha256 del contenido, calculado mientras se escribe, y los bytes escritos.
+    """
+    digest = hashlib.sha256(head)
+    written = len(head)
+    async with await anyio.open_file(file_path, "wb") as buffer:
+        await buffer.write(head)
+        while chunk := await file.read(IMAGE_UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > IMAGE_MAX_BYTES:
+                raise ImageTooLargeError(f"La imagen supera el máximo de {IMAGE_MAX_BYTES} bytes")
+            digest.update(chunk)
+            await buffer.write(chunk)
+    return digest.hexdigest(), written
+
+
+async def _process(src_path: Path, dst_path: Path) -> list[str]:
+    """Optimiza el original y genera las variantes responsive en el pool"""
+    # PIL se carga en la primera imagen (en el servidor solo si el pool usa hilos)
+    from app.utils.image_processing import process_image
+
+    return await image_pool.run(
+        process_image, str(src_path), str(dst_path), IMAGE_VARIANT_SIZES, enabled_variant_formats()
+    )
+
+
+async def _publish(src_path: Path, key: str) -> None:
+    """
+    Optimiza la imagen y genera sus variantes en un directorio de trabajo local, y
+    publica el resultado en el almacenamiento. src_path no se modifica.
+    """
+    storage = get_storage()
+    work_dir = STAGING_DIR / uuid.uuid4().hex
+    await anyio.Path(work_dir).mkdir(parents=True)
+    try:
+        dst_path = work_dir / key
+        variants = await _process(src_path, dst_path)
+        # El original se publica el último: si está, sus variantes también
+        for name in variants:
+            await storage.save(name, work_dir / name)
+        await storage.save(key, dst_path)
+    finally:
+        await to_thread.run_sync(shutil.rmtree, work_dir, True)
+
+
+async def _optimize_in_background(key: str) -> None:
+    """Optimiza la imagen ya publicada; mientras tanto se sirve el original pendiente"""
+    src_path = pending_path(key)
+    while True:
+        try:
+            await _publish(src_path, key)
+            await anyio.Path(src_path).unlink(missing_ok=True)
+            return
+        except WorkerPoolBusy as e:
+            await asyncio.sleep(e.retry_after)
+        except Exception:
+            logger.exception("No se pudo optimizar la imagen %s, se conserva el original", key)
+            return
+
+
+def _schedule_optimization(key: str) -> None:
+    task = asyncio.create_task(_optimize_in_background(key))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def resume_pending_images() -> None:
+    """Reanuda al arrancar las optimizaciones que quedaron pendientes al apagar el servidor"""
+    pending = anyio.Path(PENDING_DIR)
+    if not await pending.is_dir():
+        return
+    async for path in pending.iterdir():
+        _schedule_optimization(path.name)
+
+
+async def _is_stored(key: str) -> bool:
+    """La imagen está publicada, o en camino como original pendiente"""
+    return await get_storage().exists(key) or await anyio.Path(pending_path(key)).is_file()
+
+
+async def _store(staging_path: Path, key: str, size: int, reuse: bool = True) -> str:
+    """Procesa y publica una imagen ya validada salvo que ya exista; staging_path lo borra el llamador"""
+    storage = get_storage()
+    if reuse and await _is_stored(key):
+        # Imagen duplicada: ya está guardada (o en camino) con sus variantes
+        return f"media/{key}"
+
+    IMAGE_BYTES_PROCESSED.inc(size)
+    # Los originales pendientes solo se pueden servir desde el disco local
+    if IMAGE_OPTIMIZE_IN_BACKGROUND and storage.is_local:
+        await anyio.Path(PENDING_DIR).mkdir(parents=True, exist_ok=True)
+        # Enlace y no renombrado: staging_path tiene que seguir ahí para _store_reference
+        try:
+            await anyio.Path(pending_path(key)).hardlink_to(staging_path)
+        except FileExistsError:
+            # Otra subida de la misma imagen ya la ha dejado pendiente
+            return f"media/{key}"
+        _schedule_optimization(key)
+    else:
+        # Optimizar la imagen en el pool de procesos
+        try:
+            await _publish(staging_path, key)
+        except OSError as e:
+            raise ValueError("No se pudo procesar la imagen") from e
+    return f"media/{key}"
+
+
+async def _store_reference(session: AsyncSession, staging_path: Path, key: str, size: int) -> str:
+    """
+    Guarda la imagen y registra la referencia en la transacción de session. acquire_media
+    cancela un borrado encolado de la misma imagen, pero si MediaCleanupWorker ya lo
+    estaba haciendo espera a que termine: los archivos que se vieron antes pueden no
+    estar ya, y entonces se vuelven a publicar desde staging_path.
+    """
+    image_path = await _store(staging_path, key, size)
+    await acquire_media(session, key)
+    if not await _is_stored(key):
+        logger.info("La imagen %s se borró mientras se subía de nuevo, se vuelve a publicar", key)
+        await _store(staging_path, key, size, reuse=False)
+    return image_path
+
+
+async def save_image(file: UploadFile, session: AsyncSession) -> str:
+    """
+    Guarda una imagen subida y retorna la ruta relativa donde se guardó ('media/<clave>').
+    La clave es el sha256 de los bytes subidos: si la imagen ya existe se reutiliza
+    sin volver a procesarla. La referencia (acquire_media) queda registrada en la
+    transacción de session, que el llamador confirma junto con el perfil.
+    """
+    # Verificar el formato y las dimensiones antes de escribir nada a disco
+    image_format, head = await _read_header(file)
     
-    # Crear un nombre único para el archivo
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = MEDIA_DIR / unique_filename
-    
-    # Guardar el archivo
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Optimizar la imagen
-    with Image.open(file_path) as img:
-        # Mantener una calidad razonable pero optimizada
-        img.save(file_path, optimize=True, quality=85)
-    
-    # Retornar la ruta relativa
-    return str(file_path)
+    # La subida se escribe en un archivo temporal hasta conocer su hash
+    await anyio.Path(STAGING_DIR).mkdir(parents=True, exist_ok=True)
+    staging_path = STAGING_DIR / f"{uuid.uuid4()}{ALLOWED_FORMATS[image_format]}"
+    try:
+        digest, size = await _write_upload(file, head, staging_path)
+        return await _store_reference(session, staging_path, f"{digest}{ALLOWED_FORMATS[image_format]}", size)
+    finally:
+        await anyio.Path(staging_path).unlink(missing_ok=True)
 
-async def delete_image(image_path: str):
+
+async def save_uploaded_image(path: str, session: AsyncSession) -> str:
     """
-    Elimina una imagen del sistema de archivos
+    Como save_image, pero con una imagen que el cliente subió directamente al
+    almacenamiento (presign_upload). La subida se recoge una sola vez: después de
+    validarla y procesarla, o de rechazarla, ya no existe. Si el pool de imágenes está
+    saturado se devuelve a su sitio, para que el cliente pueda repetir la confirmación.
     """
-    if image_path:
-        path = Path(image_path)
-        if path.exists():
-            path.unlink()
\ No newline at end of file
+    storage = get_storage()
+    await anyio.Path(STAGING_DIR).mkdir(parents=True, exist_ok=True)
+    staging_path = STAGING_DIR / f"{uuid.uuid4()}.upload"
+    try:
+        size = await storage.fetch_upload(path, staging_path, IMAGE_MAX_BYTES)
+        image_format, digest = await to_thread.run_sync(_inspect_file, staging_path)
+        try:
+            return await _store_reference(session, staging_path, f"{digest}{ALLOWED_FORMATS[image_format]}", size)
+        except WorkerPoolBusy:
+            # Se responde 503 con Retry-After: el reintento debe encontrar la subida
+            await storage.restore_upload(path, staging_path)
+            raise
+    finally:
+        await anyio.Path(staging_path).unlink(missing_ok=True)
+
+
+async def wait_for_background_images() -> None:
+    """Espera a que terminen las optimizaciones pendientes (al apagar el servidor)"""
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
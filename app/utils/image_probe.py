@@ -0,0 +1,73 @@
+"""
+Detección del formato y de las dimensiones de una imagen a partir de sus primeros bytes,
+sin decodificarla. Permite rechazar subidas inválidas o demasiado grandes al principio.
+"""
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Marcadores SOF de JPEG que contienen las dimensiones del fotograma
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_format(head: bytes) -> str | None:
+    """Identifica el formato por sus bytes mágicos"""
+    if head.startswith(PNG_SIGNATURE):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+def probe_dimensions(image_format: str, head: bytes) -> tuple[int, int] | None:
+    """
+    Devuelve (ancho, alto) leyendo solo la cabecera, o None si hacen falta más bytes.
+    Lanza ValueError si la cabecera está corrupta.
+    """
+    if image_format == "png":
+        if len(head) < 24:
+            return None
+        if head[12:16] != b"IHDR":
+            raise ValueError("Cabecera PNG inválida")
+        return struct.unpack(">II", head[16:24])
+    if image_format == "gif":
+        if len(head) < 10:
+            return None
+        return struct.unpack("<HH", head[6:10])
+    if image_format == "jpeg":
+        return _probe_jpeg(head)
+    raise ValueError("Formato no soportado")
+
+
+def _probe_jpeg(head: bytes) -> tuple[int, int] | None:
+    offset = 2
+    while True:
+        if offset >= len(head):
+            return None
+        if head[offset] != 0xFF:
+            raise ValueError("Cabecera JPEG inválida")
+        # Saltar bytes de relleno 0xFF entre segmentos
+        while offset < len(head) and head[offset] == 0xFF:
+            offset += 1
+        if offset >= len(head):
+            return None
+        marker = head[offset]
+        offset += 1
+        # Marcadores sin longitud (RSTn, TEM)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("Cabecera JPEG sin dimensiones")
+        if offset + 2 > len(head):
+            return None
+        (length,) = struct.unpack(">H", head[offset:offset + 2])
+        if length < 2:
+            raise ValueError("Cabecera JPEG inválida")
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 7 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[offset + 3:offset + 7])
+            return width, height
+        offset += length
@@ -0,0 +1,63 @@
+"""
+Funciones de procesamiento de imágenes que se ejecutan en el pool de procesos.
+Este módulo solo depende de PIL para que los procesos hijos arranquen rápido.
+"""
+import os
+import tempfile
+
+from PIL import Image, features
+
+from app.core.config import IMAGE_MAX_PIXELS, IMAGE_VARIANT_QUALITY
+from app.utils.image_variants import variant_filename
+
+# Protección de PIL contra bombas de descompresión, coherente con la validación de la subida
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+
+def _save_atomic(img: Image.Image, dst_path: str, **params) -> None:
+    """Escribe primero en un archivo temporal y lo mueve con os.replace"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst_path), suffix=".part")
+    os.close(fd)
+    try:
+        img.save(tmp_path, **params)
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def optimize_image(src_path: str, dst_path: str) -> None:
+    """
+    Decodifica la imagen, la optimiza y la escribe en dst_path de forma atómica
+    """
+    with Image.open(src_path) as img:
+        # Mantener una calidad razonable pero optimizada
+        _save_atomic(img, dst_path, format=img.format, optimize=True, quality=85)
+
+
+def generate_variants(src_path: str, sizes: list[int], formats: list[str]) -> list[str]:
+    """
+    Genera las variantes reducidas junto al original y devuelve sus nombres.
+    Nunca se amplía la imagen: si es más pequeña que el tamaño pedido se conserva su tamaño.
+    """
+    formats = [fmt for fmt in formats if features.check(fmt)]
+    directory = os.path.dirname(src_path)
+    filename = os.path.basename(src_path)
+    created = []
+    with Image.open(src_path) as img:
+        has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+        base = img.convert("RGBA" if has_alpha else "RGB")
+    for size in sizes:
+        resized = base.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            name = variant_filename(filename, size, fmt)
+            _save_atomic(resized, os.path.join(directory, name), format=fmt.upper(), quality=IMAGE_VARIANT_QUALITY)
+            created.append(name)
+    return created
+
+
+def process_image(src_path: str, dst_path: str, sizes: list[int], formats: list[str]) -> list[str]:
+    """Optimiza el original y genera sus variantes en una sola tarea del pool"""
+    optimize_image(src_path, dst_path)
+    return generate_variants(dst_path, sizes, formats)
@@ -0,0 +1,88 @@
+"""
+Nombres y selección de las variantes responsive de cada imagen.
+Las variantes se guardan junto al original como '<nombre>_<tamaño>.<formato>'.
+"""
+from pathlib import PurePath
+
+from app.core.config import IMAGE_VARIANT_SIZES, IMAGE_ENABLE_AVIF, MEDIA_PUBLIC_BASE_URL
+from app.utils.media_store import media_key, media_url
+
+# Formatos de las variantes, del preferido al menos preferido, con su tipo MIME
+VARIANT_FORMATS = {"avif": "image/avif", "webp": "image/webp"}
+
+
+def enabled_variant_formats() -> list[str]:
+    return [fmt for fmt in VARIANT_FORMATS if fmt != "avif" or IMAGE_ENABLE_AVIF]
+
+
+def variant_filename(filename: str, size: int, fmt: str) -> str:
+    return f"{PurePath(filename).stem}_{size}.{fmt}"
+
+
+def all_variant_filenames(filename: str) -> list[str]:
+    return [
+        variant_filename(filename, size, fmt)
+        for size in IMAGE_VARIANT_SIZES
+        for fmt in VARIANT_FORMATS
+    ]
+
+
+def closest_variant_size(requested: int) -> int | None:
+    """El menor tamaño configurado que cubre el pedido (o el mayor si ninguno lo cubre)"""
+    if not IMAGE_VARIANT_SIZES:
+        return None
+    for size in IMAGE_VARIANT_SIZES:
+        if size >= requested:
+            return size
+    return IMAGE_VARIANT_SIZES[-1]
+
+
+def _parse_accept(accept_header: str) -> dict[str, float]:
+    """Rangos de la cabecera Accept ('image/webp', 'image/*', '*/*') con su valor q"""
+    ranges = {}
+    for item in accept_header.split(","):
+        media_range, *params = item.split(";")
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        ranges[media_range] = q
+    return ranges
+
+
+def accepted_variant_formats(accept_header: str) -> list[str]:
+    """
+    Formatos de variante que acepta el cliente según la cabecera Accept, del más al menos
+    preferido. Manda el rango más específico ('image/webp;q=0, image/*' excluye WebP).
+    """
+    ranges = _parse_accept(accept_header)
+    accepted = []
+    for fmt, mime in VARIANT_FORMATS.items():
+        candidates = (mime, f"{mime.split('/')[0]}/*", "*/*")
+        q = next((ranges[r] for r in candidates if r in ranges), 0.0)
+        if q > 0:
+            accepted.append((q, fmt))
+    # Mayor q primero; a igualdad se respeta el orden de VARIANT_FORMATS (sort estable)
+    accepted.sort(key=lambda item: -item[0])
+    return [fmt for _, fmt in accepted]
+
+
+def variant_urls(image_url: str | None) -> dict[str, str] | None:
+    """
+    URLs públicas de cada tamaño, en el mismo origen que la imagen (media_url). Por /media
+    se elige el formato según la cabecera Accept; el CDN o el bucket de
+    MEDIA_PUBLIC_BASE_URL no negocian, así que ahí se enlaza la variante WebP.
+    """
+    key = media_key(image_url)
+    if not key:
+        return None
+    if MEDIA_PUBLIC_BASE_URL:
+        return {str(size): media_url(variant_filename(key, size, "webp")) for size in IMAGE_VARIANT_SIZES}
+    return {str(size): f"{media_url(key)}?size={size}" for size in IMAGE_VARIANT_SIZES}
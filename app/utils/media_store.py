@@ -0,0 +1,140 @@
+"""
+Almacén de media direccionado por contenido.
+
+Cada imagen se guarda como '<sha256>.<ext>' dentro de subdirectorios 'ab/cd/' tomados
+del propio hash, de modo que subir la misma imagen dos veces reutiliza el mismo archivo.
+La tabla MediaBlob cuenta cuántos perfiles apuntan a cada archivo y solo se borra
+cuando deja de estar referenciado, a través de la cola persistente MediaCleanup.
+Las imágenes antiguas (nombres uuid en la raíz de 'media/') siguen funcionando y no
+tienen contador.
+"""
+import re
+from pathlib import Path, PurePath
+
+from sqlalchemy import delete, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import MEDIA_INDEX_SIZE, MEDIA_INDEX_TTL, MEDIA_PUBLIC_BASE_URL
+from app.db.database import upsert_insert
+from app.models.media import MediaBlob, MediaCleanup, utcnow
+
+MEDIA_DIR = Path("media")
+# Subidas en curso, antes de conocer su hash
+STAGING_DIR = MEDIA_DIR / "tmp"
+# Originales aceptados que esperan su optimización en segundo plano. Se sirven desde aquí
+# hasta que aparece la versión optimizada, así los archivos definitivos nunca se reescriben.
+PENDING_DIR = MEDIA_DIR / "pending"
+# Subidas directas de los clientes al almacenamiento (URLs firmadas), pendientes de confirmar
+UPLOADS_PREFIX = "uploads"
+
+# Longitud del sha256 en hexadecimal con el que empiezan las claves por contenido
+DIGEST_LEN = 64
+_CONTENT_KEY = re.compile(r"^[0-9a-f]{64}")
+
+# Metadatos precalculados (stat y ETag) de los archivos servidos por /media, por ruta
+media_index = TTLCache(maxsize=MEDIA_INDEX_SIZE, ttl=MEDIA_INDEX_TTL)
+
+
+def media_key(image_url: str | None) -> str | None:
+    """Clave (nombre de archivo) a partir de la URL o ruta guardada en el perfil"""
+    if not image_url:
+        return None
+    return image_url.split("/")[-1] or None
+
+
+def media_url(key: str | None) -> str | None:
+    """
+    URL pública que se guarda en el perfil; se calcula una sola vez al escribirlo.
+    Con MEDIA_PUBLIC_BASE_URL apunta directamente al CDN o al bucket.
+    """
+    if not key:
+        return None
+    if MEDIA_PUBLIC_BASE_URL:
+        return f"{MEDIA_PUBLIC_BASE_URL}/{storage_path(key)}"
+    return f"/media/{key}"
+
+
+def storage_path(filename: str) -> str:
+    """Ruta relativa de un archivo de media o de una de sus variantes en el almacenamiento"""
+    if _CONTENT_KEY.match(filename):
+        return f"{filename[:2]}/{filename[2:4]}/{filename}"
+    # Archivos anteriores al almacén por contenido
+    return filename
+
+
+def media_path(filename: str) -> Path:
+    """Ruta en disco (almacenamiento local) de un archivo de media o de una de sus variantes"""
+    return MEDIA_DIR / storage_path(filename)
+
+
+def upload_path(user_id: int, upload_id: str) -> str:
+    """Ruta relativa de una subida directa antes de validarla y procesarla"""
+    return f"{UPLOADS_PREFIX}/{user_id}/{upload_id}"
+
+
+def pending_path(key: str) -> Path:
+    return PENDING_DIR / key
+
+
+def is_content_key(filename: str) -> bool:
+    return bool(_CONTENT_KEY.match(filename))
+
+
+def image_group(filename: str) -> str:
+    """
+    Identificador común del original, sus variantes y su copia pendiente: el hash en
+    el almacén por contenido, o el nombre sin extensión ni sufijo de tamaño en las
+    imágenes antiguas ('<uuid>.jpg' y '<uuid>_320.webp').
+    """
+    if is_content_key(filename):
+        return filename[:DIGEST_LEN]
+    return PurePath(filename).stem.partition("_")[0]
+
+
+async def acquire_media(session: AsyncSession, key: str) -> None:
+    """
+    Suma una referencia al archivo (dentro de la transacción del llamador). Es un upsert:
+    dos subidas simultáneas de la misma imagen nueva no chocan en la clave primaria.
+
+    También cancela el borrado encolado de la misma imagen. MediaCleanupWorker retiene
+    las entradas que está atendiendo hasta haber borrado los archivos, así que si el
+    borrado ya estaba en marcha esto espera a que acabe: después hay que comprobar que
+    los archivos siguen ahí (lo hace app.utils.image_handler).
+    """
+    await session.exec(
+        (await upsert_insert(session))(MediaBlob)
+        .values(key=key, refcount=1)
+        .on_conflict_do_update(index_elements=[MediaBlob.key], set_={"refcount": MediaBlob.refcount + 1})
+    )
+    # La entrada puede ser cualquier archivo de la imagen (el barrido encola el que encuentra)
+    group = image_group(key)
+    await session.exec(
+        delete(MediaCleanup).where(MediaCleanup.key >= group, MediaCleanup.key < group + "~")
+    )
+
+
+async def release_media(session: AsyncSession, key: str) -> bool:
+    """
+    Resta una referencia. Si el archivo ya no lo usa nadie, lo encola en MediaCleanup
+    dentro de la misma transacción y devuelve True; el borrado lo hace MediaCleanupWorker
+    (app.services.media_cleanup) después del commit.
+    """
+    # Un solo UPDATE: dos liberaciones simultáneas no pueden perder una resta
+    remaining = (await session.exec(
+        update(MediaBlob)
+        .where(MediaBlob.key == key)
+        .values(refcount=MediaBlob.refcount - 1)
+        .returning(MediaBlob.refcount)
+    )).scalar_one_or_none()
+    if remaining is not None:
+        if remaining > 0:
+            return False
+        await session.exec(delete(MediaBlob).where(MediaBlob.key == key))
+    # Sin contador (imagen antigua) solo la usaba este perfil
+    await session.exec(
+        (await upsert_insert(session))(MediaCleanup)
+        .values(key=key, attempts=0, not_before=utcnow())
+        .on_conflict_do_update(index_elements=[MediaCleanup.key], set_={"attempts": 0, "not_before": utcnow()})
+    )
+    return True
@@ -0,0 +1,26 @@
+import base64
+import json
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Genera un cursor opaco a partir del último id devuelto en la página
+    """
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Recupera el último id a partir de un cursor opaco.
+    Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = data["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Cursor inválido") from e
+    if not isinstance(last_id, int) or last_id < 0:
+        raise ValueError("Cursor inválido")
+    return last_id
@@ -0,0 +1,14 @@
+"""
+Benchmarks de los endpoints más usados de la API.
+
+    python -m benchmarks.run --users 10000 --profiles 5000 --concurrency 32
+    python -m benchmarks.run --mode uvicorn --workers 4 --output base.json
+    python -m benchmarks.run --compare base.json
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.change_feed --subscribers 10000
+
+Cada ejecución crea una base de datos SQLite y un directorio media temporales,
+los rellena con datos sintéticos y mide cada escenario por separado. benchmarks.startup
+mide el arranque en frío de un worker (tiempo hasta estar listo y memoria residente) y
+benchmarks.change_feed el coste de las conexiones abiertas al feed de cambios.
+"""
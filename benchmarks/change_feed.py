@@ -0,0 +1,82 @@
+"""
+Coste del feed de cambios (/profiles/events) dentro de un worker: memoria de las
+conexiones en reposo y latencia de reparto de un evento a todos sus seguidores.
+
+Cada conexión se simula con una tarea que consume ChangeFeedBroker.stream, como hace
+la respuesta SSE, sin la parte HTTP.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.stats import percentile
+
+
+async def run(subscribers: int, follows: int, events: int) -> dict:
+    from app.core.startup import current_rss_bytes
+    from app.services.change_feed import ChangeFeedBroker
+
+    broker = ChangeFeedBroker(queue_size=64, max_subscribers=subscribers, keepalive=3600, max_lifetime=3600)
+    await broker.start()
+    received = asyncio.Event()
+    pending = 0
+
+    async def consume(index: int) -> None:
+        nonlocal pending
+        # Cada conexión sigue 'follows' usuarios; el usuario 0 lo siguen todas
+        user_ids = [0] + [1 + (index * follows + k) % 100_000 for k in range(follows - 1)]
+        async for frame in broker.stream(user_ids):
+            if frame.startswith(b"event:"):
+                pending -= 1
+                if pending == 0:
+                    received.set()
+
+    rss_before = current_rss_bytes()
+    tasks = [asyncio.create_task(consume(i)) for i in range(subscribers)]
+    # Dejar que todas lleguen a esperar en su cola
+    await asyncio.sleep(0.5)
+    rss_idle = current_rss_bytes()
+
+    latencies = []
+    for _ in range(events):
+        received.clear()
+        pending = subscribers
+        start = time.perf_counter()
+        await broker.publish("profile.updated", 0, ["bio"])
+        await received.wait()
+        latencies.append(time.perf_counter() - start)
+
+    await broker.stop()
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    return {
+        "subscribers": subscribers,
+        "idle_kib_per_subscriber": (rss_idle - rss_before) / subscribers / 1024,
+        "fanout_p50_ms": percentile(latencies, 50) * 1000,
+        "fanout_p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.change_feed", description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10_000, help="Conexiones simuladas")
+    parser.add_argument("--follows", type=int, default=20, help="Usuarios que sigue cada conexión")
+    parser.add_argument("--events", type=int, default=50, help="Eventos publicados para medir el reparto")
+    parser.add_argument("--output", type=Path, help="Guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.subscribers, args.follows, args.events))
+    print(
+        f"{result['subscribers']} conexiones: {result['idle_kib_per_subscriber']:.1f} KiB por conexión en reposo, "
+        f"reparto p50 {result['fanout_p50_ms']:.1f} ms, p99 {result['fanout_p99_ms']:.1f} ms"
+    )
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
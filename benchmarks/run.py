@@ -0,0 +1,288 @@
+"""
+Ejecuta los escenarios contra la aplicación en el mismo proceso (transporte ASGI
+de httpx) o contra un servidor uvicorn real, con N clientes concurrentes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+from benchmarks.seed import PASSWORD, seed_database, synthetic_images, user_email
+from benchmarks.stats import compare, format_table, summarize
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Escenario -> peticiones por defecto (las subidas y los logins son mucho más caros)
+DEFAULT_SCENARIOS = "login:200,me,profile,users,upload:50"
+
+
+@dataclass
+class Context:
+    users: int
+    profiles: int
+    tokens: dict[int, str] = field(default_factory=dict)
+    images: list[bytes] = field(default_factory=list)
+
+    def user_id(self, i: int) -> int:
+        return i % self.users + 1
+
+    def profile_user_id(self, i: int) -> int:
+        return i % self.profiles + 1
+
+    def token_headers(self, user_id: int) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+
+async def _login(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.post("/login", json={"email": user_email(ctx.user_id(i)), "password": PASSWORD})
+
+
+async def _me(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.get("/me", headers=ctx.token_headers(ctx.profile_user_id(i)))
+
+
+async def _profile(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.get(f"/profiles/{ctx.profile_user_id(i)}")
+
+
+async def _profiles_batch(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    # Una página de un listado de miembros: 50 perfiles en una sola petición
+    return await client.post("/profiles/batch", json={"user_ids": [ctx.profile_user_id(i + k) for k in range(50)]})
+
+
+async def _users(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.get("/users/", params={"limit": 50})
+
+
+async def _upload(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    image = ctx.images[i % len(ctx.images)]
+    return await client.patch(
+        "/profiles/me",
+        headers=ctx.token_headers(ctx.profile_user_id(i)),
+        data={"bio": f"bench {i}"},
+        files={"image": (f"bench{i}.jpg", image, "image/jpeg")},
+    )
+
+
+SCENARIOS = {
+    "login": _login,
+    "me": _me,
+    "profile": _profile,
+    "profiles_batch": _profiles_batch,
+    "users": _users,
+    "upload": _upload,
+}
+
+
+def parse_scenarios(spec: str, default_requests: int) -> list[tuple[str, int]]:
+    scenarios = []
+    for item in spec.split(","):
+        name, _, count = item.strip().partition(":")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Escenario desconocido: {name} (disponibles: {', '.join(SCENARIOS)})")
+        scenarios.append((name, int(count) if count else default_requests))
+    return scenarios
+
+
+def configure_environment(workdir: Path, args: argparse.Namespace) -> dict[str, str]:
+    """Variables de entorno de la aplicación bajo prueba (antes de importar app)"""
+    env = {
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.sqlite3'}",
+        # Los límites por IP rechazarían la carga generada desde una sola máquina
+        "RATE_LIMIT_ENABLED": "0",
+    }
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.update(env)
+    return env
+
+
+def issue_tokens(ctx: Context) -> None:
+    """Tokens de una hora firmados directamente, sin pasar por bcrypt"""
+    from app.auth.auth import build_token_claims, create_access_token
+    from app.models.user import User
+
+    for user_id in range(1, ctx.profiles + 1):
+        user = User(id=user_id, username=f"user{user_id}", email=user_email(user_id), hashed_password="")
+        ctx.tokens[user_id] = create_access_token(build_token_claims(user), timedelta(hours=1))
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, name: str, ctx: Context, requests: int, concurrency: int, first: int = 0
+) -> dict:
+    """Lanza las peticiones first..first+requests repartidas entre 'concurrency' clientes"""
+    fn = SCENARIOS[name]
+    latencies: list[float] = []
+    errors = 0
+    indices = iter(range(first, first + requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in indices:
+            start = time.perf_counter()
+            try:
+                response = await fn(client, ctx, i)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_all(client: httpx.AsyncClient, ctx: Context, args: argparse.Namespace) -> dict[str, dict]:
+    results = {}
+    for name, requests in parse_scenarios(args.scenarios, args.requests):
+        # Calentamiento: cachés, conexiones y arranque de los pools de procesos
+        # (con índices propios, para que las subidas no repitan imagen)
+        await run_scenario(client, name, ctx, min(args.warmup, requests), args.concurrency, first=requests)
+        results[name] = await run_scenario(client, name, ctx, requests, args.concurrency)
+        print(f"  {name}: {results[name]['throughput']:.1f} req/s", file=sys.stderr)
+    return results
+
+
+async def run_in_process(ctx: Context, args: argparse.Namespace) -> dict[str, dict]:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run_all(client, ctx, args)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("uvicorn terminó antes de estar listo")
+        try:
+            if (await client.get("/users/", params={"limit": 1})).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("uvicorn no respondió a tiempo")
+
+
+async def run_uvicorn(ctx: Context, args: argparse.Namespace, workdir: Path, env: dict[str, str]) -> dict[str, dict]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env={**os.environ, **env, "PYTHONPATH": str(ROOT_DIR)},
+    )
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await _wait_until_ready(client, process)
+            return await run_all(client, ctx, args)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn (modo uvicorn)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="nombre[:peticiones],...")
+    parser.add_argument("--requests", type=int, default=1000, help="Peticiones por escenario si no se indican")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--image-size", type=int, default=800, help="Lado de las imágenes sintéticas")
+    parser.add_argument("--bcrypt-rounds", type=int, help="Coste de bcrypt de la aplicación bajo prueba")
+    parser.add_argument("--output", type=Path, help="Guardar los resultados en JSON (línea base)")
+    parser.add_argument("--compare", type=Path, help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Fracción tolerada antes de fallar")
+    parser.add_argument("--keep", action="store_true", help="No borrar la base de datos y media temporales")
+    args = parser.parse_args(argv)
+    if args.profiles > args.users:
+        parser.error("--profiles no puede superar --users")
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    # La aplicación usa rutas relativas para media; los imports de app salen de ROOT_DIR
+    sys.path.insert(0, str(ROOT_DIR))
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        env = configure_environment(workdir, args)
+        print(f"Sembrando {args.users} usuarios y {args.profiles} perfiles en {workdir}", file=sys.stderr)
+        seed_database(args.users, args.profiles)
+
+        ctx = Context(users=args.users, profiles=args.profiles)
+        issue_tokens(ctx)
+        upload_requests = dict(parse_scenarios(args.scenarios, args.requests)).get("upload", 0)
+        if upload_requests:
+            ctx.images = synthetic_images(upload_requests + args.warmup, args.image_size)
+
+        if args.mode == "uvicorn":
+            results = asyncio.run(run_uvicorn(ctx, args, workdir, env))
+        else:
+            results = asyncio.run(run_in_process(ctx, args))
+    finally:
+        os.chdir(previous_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_table(results))
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        text, regressed = compare(results, baseline, args.max_regression)
+        print()
+        print(text)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
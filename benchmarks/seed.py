@@ -0,0 +1,70 @@
+"""Datos sintéticos para los benchmarks: usuarios, perfiles e imágenes."""
+import io
+import random
+
+from PIL import Image
+from sqlalchemy import insert
+from sqlmodel import Session
+
+# Todos los usuarios sembrados comparten contraseña: hashearla una vez por usuario
+# con bcrypt haría que sembrar 100k usuarios tardase horas
+PASSWORD = "benchmark-password"
+SEED_BATCH_SIZE = 5000
+
+
+def user_email(user_id: int) -> str:
+    return f"user{user_id}@bench.local"
+
+
+def seed_database(users: int, profiles: int) -> None:
+    """Crea el esquema y siembra usuarios 1..users, con perfil los primeros 'profiles'"""
+    # Se importa aquí para que el entorno (DATABASE_URL, etc.) ya esté configurado
+    from app.core.security import get_password_hash
+    from app.db.database import create_db_and_tables, engine
+    from app.models.user import Profile, User
+
+    create_db_and_tables()
+    hashed = get_password_hash(PASSWORD)
+    with Session(engine) as session:
+        for start in range(1, users + 1, SEED_BATCH_SIZE):
+            ids = range(start, min(start + SEED_BATCH_SIZE, users + 1))
+            session.execute(insert(User), [
+                {
+                    "id": i,
+                    "username": f"user{i}",
+                    "email": user_email(i),
+                    "full_name": f"Usuario {i}",
+                    "is_active": True,
+                    "hashed_password": hashed,
+                }
+                for i in ids
+            ])
+        for start in range(1, min(profiles, users) + 1, SEED_BATCH_SIZE):
+            ids = range(start, min(start + SEED_BATCH_SIZE, profiles + 1, users + 1))
+            session.execute(insert(Profile), [
+                {
+                    "user_id": i,
+                    "bio": f"Perfil de prueba {i}",
+                    "location": "Benchmark",
+                    "website": f"https://example.com/{i}",
+                }
+                for i in ids
+            ])
+        session.commit()
+
+
+def synthetic_images(count: int, size: int, seed: int = 0) -> list[bytes]:
+    """
+    JPEGs distintos entre sí (ruido sobre un degradado), para que el almacén por
+    contenido no reutilice una subida anterior y cada petición procese su imagen.
+    """
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        noise = Image.effect_noise((size, size), rng.uniform(20, 80))
+        gradient = Image.linear_gradient("L").resize((size, size))
+        image = Image.merge("RGB", (noise, gradient, gradient.rotate(rng.choice([90, 180, 270]))))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
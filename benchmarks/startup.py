@@ -0,0 +1,101 @@
+"""
+Arranque en frío de un worker: lanza procesos nuevos que importan app.main y
+ejecutan el arranque de la aplicación, con y sin FAST_STARTUP, y compara el tiempo
+hasta estar listo y la memoria residente de un worker en reposo.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.stats import percentile
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Se ejecuta en cada proceso medido; imprime una línea JSON con sus tiempos
+_CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        from app.core.startup import current_rss_bytes
+        print(json.dumps({
+            "import_ms": (imported - started) * 1000,
+            "startup_ms": (ready - imported) * 1000,
+            "rss_mib": current_rss_bytes() / 2**20,
+        }))
+
+asyncio.run(main())
+"""
+
+MODES = {"full": "0", "fast": "1"}
+
+
+def measure(mode: str, workdir: Path, env: dict[str, str]) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=workdir,
+        env={**os.environ, **env, "FAST_STARTUP": MODES[mode]},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    # Incluye el arranque del intérprete
+    sample["process_ms"] = (time.perf_counter() - start) * 1000
+    return sample
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="Arranques medidos por modo")
+    parser.add_argument("--output", type=Path, help="Guardar los resultados en JSON")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    env = {
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.sqlite3'}",
+        "PYTHONPATH": str(ROOT_DIR),
+        # Sin barrido de media: no forma parte del arranque
+        "MEDIA_SWEEP_INTERVAL": "0",
+    }
+    try:
+        # FAST_STARTUP necesita el esquema ya migrado
+        subprocess.run(
+            [sys.executable, "-m", "app.cli", "migrate"], cwd=workdir, env={**os.environ, **env}, check=True
+        )
+        results = {}
+        for mode in MODES:
+            # Primer arranque descartado: calienta la caché de disco y los .pyc
+            measure(mode, workdir, env)
+            samples = [measure(mode, workdir, env) for _ in range(args.runs)]
+            results[mode] = {
+                key: percentile(sorted(sample[key] for sample in samples), 50)
+                for key in ("process_ms", "import_ms", "startup_ms", "rss_mib")
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'modo':<6} {'proceso ms':>11} {'import ms':>10} {'arranque ms':>12} {'RSS MiB':>8}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<6} {r['process_ms']:>11.0f} {r['import_ms']:>10.0f} "
+            f"{r['startup_ms']:>12.0f} {r['rss_mib']:>8.1f}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Estadísticas de latencia y comparación con una línea base guardada."""
+import math
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Percentil por rango más cercano sobre valores ya ordenados"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def format_table(results: dict[str, dict]) -> str:
+    header = f"{'escenario':<12} {'peticiones':>10} {'errores':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<12} {r['requests']:>10} {r['errors']:>8} {r['throughput']:>9.1f} "
+            f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+
+def compare(current: dict[str, dict], baseline: dict[str, dict], max_regression: float) -> tuple[str, bool]:
+    """
+    Compara p95 y throughput con la línea base. Devuelve el informe y si hay
+    alguna regresión mayor que max_regression (fracción, 0.1 = 10 %).
+    """
+    lines = [f"{'escenario':<12} {'p95 base':>10} {'p95 ahora':>10} {'Δ p95':>8} {'req/s base':>11} {'req/s ahora':>12} {'Δ req/s':>8}"]
+    regressed = False
+    for name, r in current.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name:<12} (sin línea base)")
+            continue
+        p95_change = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        tput_change = (r["throughput"] - base["throughput"]) / base["throughput"] if base["throughput"] else 0.0
+        flag = ""
+        if p95_change > max_regression or tput_change < -max_regression:
+            regressed = True
+            flag = "  << regresión"
+        lines.append(
+            f"{name:<12} {base['p95_ms']:>10.2f} {r['p95_ms']:>10.2f} {p95_change:>+8.1%} "
+            f"{base['throughput']:>11.1f} {r['throughput']:>12.1f} {tput_change:>+8.1%}{flag}"
+        )
+    return "\n".join(lines), regressed